@@ -0,0 +1,97 @@
+# Benchmark of the mesh export stage with both FBX writers (Blender's exporter and utils.fbx_writer) on an item made of
+# a UV sphere of growing density, with a bevel modifier, two materials and both UV layers. Needs bpy, e.g.:
+#   blender -b --python benchmarks/fbx_writer.py -- --segments 32 256 1024
+#   python3 benchmarks/fbx_writer.py  (with the bpy module installed)
+import argparse
+import importlib
+import pathlib
+import sys
+import tempfile
+import time
+
+import bpy
+import addon_utils
+
+_ADDON_DIR = pathlib.Path(__file__).resolve().parents[1]
+_FBX_WRITERS = ['BLENDER', 'NATIVE']
+
+
+def _get_arguments():
+    parser = argparse.ArgumentParser(prog='fbx_writer.py', description='Benchmarks the mesh export stage with both FBX writers.')
+    parser.add_argument('--segments', type=int, nargs='+', default=[32, 256, 1024], help='segments of the benchmarked UV spheres')
+    parser.add_argument('--repeat', type=int, default=3, help='exports with each writer, the fastest is reported')
+    # Blender passes arguments after '--' to scripts, plain python passes them all
+    return parser.parse_args(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:])
+
+def _import_addon_module(name):
+    return importlib.import_module(_ADDON_DIR.name + '.' + name)
+
+# Empty scene with the add-on enabled (factory settings disable it), exporting to user_dir
+def _setup_scene(segments, user_dir):
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    if str(_ADDON_DIR.parent) not in sys.path:
+        sys.path.append(str(_ADDON_DIR.parent))
+    addon_utils.enable(_ADDON_DIR.name, default_set=True)
+    addon_preferences = bpy.context.preferences.addons[_ADDON_DIR.name].preferences
+    addon_preferences.user_dir = str(user_dir)
+    
+    collection = bpy.data.collections.new('Item')
+    bpy.context.scene.collection.children.link(collection)
+    collection.trackmania_item.export_type = 'SINGLE'
+    
+    bpy.ops.mesh.primitive_uv_sphere_add(segments=segments, ring_count=max(3, segments // 2))
+    object = bpy.context.active_object
+    for users_collection in object.users_collection:
+        users_collection.objects.unlink(object)
+    collection.objects.link(object)
+    object.location = (0.5, -1, 2)
+    object.rotation_euler = (0.3, 0.2, 1.0)
+    mesh = object.data
+    mesh.uv_layers[0].name = 'BaseMaterial'
+    mesh.uv_layers.new(name='Lightmap')
+    for name in ['PlatformTech', 'Grass']:
+        mesh.materials.append(bpy.data.materials.new(name))
+    mesh.polygons.foreach_set('material_index', [index % 2 for index in range(len(mesh.polygons))])
+    object.modifiers.new('Bevel', 'BEVEL').width = 0.01
+    return collection, addon_preferences
+
+def _time_export(collection, repeat):
+    base = _import_addon_module('operators.base')
+    mesh = _import_addon_module('operators.mesh')
+    durations = []
+    for _ in range(max(1, repeat)):
+        plan = base.ExportPlan(bpy.context, list(collection.objects))
+        item = plan.items[0]
+        for object in bpy.context.view_layer.objects:
+            object.select_set(object in item.objects)
+        start = time.perf_counter()
+        success = item.run(_Reporter(), bpy.context, mesh.export_mesh)
+        durations.append(time.perf_counter() - start)
+        if not success:
+            raise RuntimeError('failed to export mesh')
+    return min(durations), item.mesh_path.stat().st_size
+
+def main():
+    arguments = _get_arguments()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for segments in arguments.segments:
+            collection, addon_preferences = _setup_scene(segments, temp_dir)
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+            object = collection.objects[0]
+            loop_count = len(object.evaluated_get(depsgraph).data.loops)
+            timings = []
+            for fbx_writer in _FBX_WRITERS:
+                addon_preferences.fbx_writer = fbx_writer
+                duration, size = _time_export(collection, arguments.repeat)
+                timings.append(duration)
+                print('{} segments ({} loops), {}: {:.3f}s, {:.1f} KB'.format(segments, loop_count, fbx_writer.lower(), duration, size / 1024))
+            print('{} segments: native writer {:.1f}x faster'.format(segments, timings[0] / max(timings[1], 1e-9)))
+    return 0
+
+class _Reporter:
+    def report(self, type, message):
+        if 'ERROR' in type:
+            print('ERROR: ' + message)
+
+if __name__ == '__main__':
+    sys.exit(main())
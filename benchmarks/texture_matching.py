@@ -0,0 +1,90 @@
+# Micro-benchmark of default material texture matching: forbidden suffix filtering and perfect match lookup on a
+# synthetic texture listing, indexed (utils.textures) against the linear scans they replaced. Needs bpy, e.g.:
+#   blender -b --python benchmarks/texture_matching.py -- --textures 20000 --materials 600
+#   python3 benchmarks/texture_matching.py  (with the bpy module installed)
+# Exits with 1 when both give different matches.
+import argparse
+import importlib
+import pathlib
+import random
+import sys
+import time
+
+_ADDON_DIR = pathlib.Path(__file__).resolve().parents[1]
+_TEXTURE_EXT = '.dds'
+
+
+def _get_arguments():
+    parser = argparse.ArgumentParser(prog='texture_matching.py', description='Benchmarks default material texture matching.')
+    parser.add_argument('--textures', type=int, default=20000, help='synthetic textures listed')
+    parser.add_argument('--materials', type=int, default=600, help='materials to match')
+    parser.add_argument('--stems', type=int, default=7000, help='distinct texture names before suffixes')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each implementation, the fastest is reported')
+    parser.add_argument('--seed', type=int, default=3)
+    # Blender passes arguments after '--' to scripts, plain python passes them all
+    return parser.parse_args(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:])
+
+def _import_textures():
+    if str(_ADDON_DIR.parent) not in sys.path:
+        sys.path.append(str(_ADDON_DIR.parent))
+    return importlib.import_module(_ADDON_DIR.name + '.utils.textures')
+
+# Texture names made of random stems and suffixes (preferred, forbidden, none or unknown), materials among the stems
+def _get_catalog(arguments, preferred_suffixes, forbidden_suffixes):
+    rng = random.Random(arguments.seed)
+    stems = ['Material{:05d}'.format(index) for index in range(arguments.stems)]
+    suffixes = sorted(set(preferred_suffixes) | set(forbidden_suffixes) | {'', '_Unknown'})
+    texture_names = [rng.choice(stems) + rng.choice(suffixes) + _TEXTURE_EXT for _ in range(arguments.textures)]
+    materials = rng.sample(stems, min(arguments.materials, len(stems)))
+    return texture_names, materials
+
+# Matching as it was before textures were indexed: every suffix compared for every texture, every texture scanned for
+# every material and preferred suffix
+def _match_linear(texture_names, materials, preferred_suffixes, forbidden_suffixes):
+    allowed_names = []
+    for name in texture_names:
+        if not any(name[-len(suffix + _TEXTURE_EXT):] == suffix + _TEXTURE_EXT for suffix in forbidden_suffixes):
+            allowed_names.append(name)
+    matches = {}
+    for material in materials:
+        for suffix in preferred_suffixes:
+            name = next((name for name in allowed_names if name == material + suffix + _TEXTURE_EXT), None)
+            if name is not None:
+                matches[material] = name
+                break
+    return matches
+
+def _match_indexed(textures, texture_names, materials, preferred_suffixes, forbidden_suffixes):
+    forbidden_endings = textures._get_endings(forbidden_suffixes, _TEXTURE_EXT)
+    allowed_names = [name for name in texture_names if not textures._has_ending(name, forbidden_endings)]
+    index = textures._get_perfect_match_index(allowed_names, preferred_suffixes, _TEXTURE_EXT)
+    return {material: allowed_names[index[material]] for material in materials if material in index}
+
+def _time(function, repeat):
+    durations = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - start)
+    return min(durations), result
+
+def main():
+    arguments = _get_arguments()
+    textures = _import_textures()
+    texture_dirs, preferred_suffixes, forbidden_suffixes, keywords = textures._read_default_materials_ini(textures._INI_FILEPATH)
+    texture_names, materials = _get_catalog(arguments, preferred_suffixes, forbidden_suffixes)
+    print('{} textures, {} materials, preferred suffixes: {}, forbidden suffixes: {}'.format(
+        len(texture_names), len(materials), ', '.join(repr(suffix) for suffix in preferred_suffixes), len(forbidden_suffixes)))
+    
+    linear_duration, linear_matches = _time(lambda: _match_linear(texture_names, materials, preferred_suffixes, forbidden_suffixes), arguments.repeat)
+    indexed_duration, indexed_matches = _time(lambda: _match_indexed(textures, texture_names, materials, preferred_suffixes, forbidden_suffixes), arguments.repeat)
+    print('linear scan: {:.3f}s, indexed: {:.3f}s ({:.0f}x), {} perfect matches'.format(
+        linear_duration, indexed_duration, linear_duration / max(indexed_duration, 1e-9), len(indexed_matches)))
+    if linear_matches != indexed_matches:
+        print('ERROR: matches differ for {} material(s)'.format(sum(linear_matches.get(material) != indexed_matches.get(material) for material in materials)))
+        return 1
+    print('identical matches')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
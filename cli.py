@@ -0,0 +1,194 @@
+# Headless batch export of one or many .blend files, e.g.:
+#   blender -b --python cli.py -- --workers 4 --user-dir ~/Documents/Trackmania items/*.blend
+#   python3 cli.py --blender /opt/blender/blender items/*.blend
+# Every .blend file is exported by its own `blender -b` worker process (up to --workers at the same time), each worker
+# exports all exportable collections of its file like Export All would, then a JSON summary is printed on stdout.
+import argparse
+import concurrent.futures
+import importlib
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import time
+
+_ADDON_DIR = pathlib.Path(__file__).resolve().parent
+_RESULT_PREFIX = 'TRACKMANIA_EXPORT_RESULT '
+# --stages names of the export stages (functions of operators.all.export_stages)
+_STAGE_FUNCTION_NAMES = {
+    'mesh': 'export_mesh',
+    'mesh_params': 'export_mesh_params',
+    'icon': 'export_icon',
+    'item': 'export_item',
+    'nadeo_import': 'nadeo_import',
+}
+
+
+def _get_arguments(argv):
+    parser = argparse.ArgumentParser(prog='cli.py', description='Exports Trackmania items of .blend files without UI.')
+    parser.add_argument('files', nargs='*', help='.blend files to export')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2), help='Blender processes running at the same time')
+    parser.add_argument('--blender', help='Blender executable used by workers (defaults to the running Blender or "blender")')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds after which a worker is killed')
+    parser.add_argument('--user-dir', help='Trackmania user directory, overrides add-on preferences')
+    parser.add_argument('--install-dir', help='Trackmania install directory, overrides add-on preferences')
+    parser.add_argument('--author-name', help='author name, overrides add-on preferences')
+    parser.add_argument('--stages', default=','.join(_STAGE_FUNCTION_NAMES), help='comma separated export stages among: ' + ', '.join(_STAGE_FUNCTION_NAMES))
+    parser.add_argument('--order', choices=['ITEM', 'STAGE'], default='ITEM', help='run stages per item or per stage')
+    parser.add_argument('--full', action='store_true', help='export every stage even when its inputs did not change')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    arguments = parser.parse_args(argv)
+    unknown_stage_names = [stage_name for stage_name in _get_stage_names(arguments) if stage_name not in _STAGE_FUNCTION_NAMES]
+    if unknown_stage_names:
+        parser.error('unknown export stage(s): {}'.format(', '.join(unknown_stage_names)))
+    return arguments
+
+def _get_stage_names(arguments):
+    return [stage_name.strip() for stage_name in arguments.stages.split(',') if stage_name.strip()]
+
+# Selected stages in export order, matched by function name so that reordering or adding export stages can't pick the
+# wrong ones
+def _get_stages(export_stages, stage_names):
+    stages_by_name = {stage.__name__: stage for stage in export_stages}
+    function_names = [_STAGE_FUNCTION_NAMES[stage_name] for stage_name in stage_names]
+    missing_function_names = [function_name for function_name in function_names if function_name not in stages_by_name]
+    if missing_function_names:
+        raise ValueError('export stage(s) not found: {}'.format(', '.join(missing_function_names)))
+    return [stage for stage in export_stages if stage.__name__ in function_names]
+
+def _get_script_arguments():
+    # Blender passes arguments after '--' to scripts, plain python passes them all
+    if '--' in sys.argv:
+        return sys.argv[sys.argv.index('--') + 1:]
+    if 'bpy' in sys.modules:
+        return []
+    return sys.argv[1:]
+
+def _get_blender_executable(arguments):
+    if arguments.blender:
+        return arguments.blender
+    try:
+        import bpy
+        if bpy.app.binary_path:
+            return bpy.app.binary_path
+    except ImportError:
+        pass
+    return 'blender'
+
+def _get_forwarded_arguments(arguments):
+    forwarded = ['--stages', arguments.stages, '--order', arguments.order]
+    for option in ['user_dir', 'install_dir', 'author_name']:
+        value = getattr(arguments, option)
+        if value is not None:
+            forwarded += ['--' + option.replace('_', '-'), value]
+    if arguments.full:
+        forwarded.append('--full')
+    return forwarded
+
+def _run_worker_process(blender, filepath, forwarded_arguments, timeout):
+    command = [blender, '-b', str(filepath), '--python-exit-code', '1', '--python', str(pathlib.Path(__file__).resolve()), '--', '--worker'] + forwarded_arguments
+    start = time.perf_counter()
+    summary = {'file': str(filepath), 'returncode': None, 'items': [], 'messages': []}
+    try:
+        process = subprocess.run(command, capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        summary['messages'].append(['ERROR', 'Worker timed out after {:.1f}s.'.format(timeout)])
+    except OSError as e:
+        summary['messages'].append(['ERROR', 'Failed to start Blender: {}'.format(e)])
+    else:
+        summary['returncode'] = process.returncode
+        stdout = process.stdout.decode('utf-8', errors='replace')
+        results = [line[len(_RESULT_PREFIX):] for line in stdout.splitlines() if line.startswith(_RESULT_PREFIX)]
+        if results:
+            summary.update(json.loads(results[-1]))
+        else:
+            stderr = process.stderr.decode('utf-8', errors='replace').strip()
+            summary['messages'].append(['ERROR', 'Worker exited without result: ' + (stderr.splitlines()[-1] if stderr else 'no output')])
+    summary['duration'] = time.perf_counter() - start
+    return summary
+
+def _run_files(arguments):
+    blender = _get_blender_executable(arguments)
+    forwarded_arguments = _get_forwarded_arguments(arguments)
+    summaries = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, arguments.workers)) as executor:
+        futures = [executor.submit(_run_worker_process, blender, filepath, forwarded_arguments, arguments.timeout) for filepath in arguments.files]
+        for future in concurrent.futures.as_completed(futures):
+            summary = future.result()
+            print('{}: {} item(s), {} failed'.format(summary['file'], len(summary['items']), sum(not item['success'] for item in summary['items'])), file=sys.stderr)
+            summaries.append(summary)
+    
+    summaries.sort(key=lambda summary: summary['file'])
+    failed_files = [summary['file'] for summary in summaries if summary['returncode'] != 0]
+    items = [item for summary in summaries for item in summary['items']]
+    print(json.dumps({
+        'files': summaries,
+        'file_count': len(summaries),
+        'failed_files': failed_files,
+        'item_count': len(items),
+        'failed_item_count': sum(not item['success'] for item in items),
+    }, indent=1))
+    return 1 if failed_files else 0
+
+# Collects what stages report, like an operator would
+class _Reporter:
+    def __init__(self):
+        self.messages = []
+    
+    def report(self, type, message):
+        level = 'ERROR' if 'ERROR' in type else 'WARNING' if 'WARNING' in type else 'INFO'
+        self.messages.append([level, message])
+        print('{}: {}'.format(level, message), file=sys.stderr)
+
+def _run_worker(arguments):
+    import addon_utils
+    import bpy
+    
+    # Works both when installed in Blender's add-ons and from a checkout
+    if str(_ADDON_DIR.parent) not in sys.path:
+        sys.path.append(str(_ADDON_DIR.parent))
+    addon_name = _ADDON_DIR.name
+    addon_utils.enable(addon_name, default_set=True)
+    base = importlib.import_module(addon_name + '.operators.base')
+    all = importlib.import_module(addon_name + '.operators.all')
+    material_properties = importlib.import_module(addon_name + '.properties.material')
+    manifest_utils = importlib.import_module(addon_name + '.utils.manifest')
+    preferences = importlib.import_module(addon_name + '.utils.preferences')
+    
+    context = bpy.context
+    addon_preferences = preferences.get(context)
+    for option in ['user_dir', 'install_dir', 'author_name']:
+        value = getattr(arguments, option)
+        if value is not None:
+            setattr(addon_preferences, option, value)
+    
+    stages = _get_stages(all.export_stages, _get_stage_names(arguments))
+    
+    material_properties.update_trackmania_materials(context)
+    reporter = _Reporter()
+    plan = base.ExportPlan(context, list(context.blend_data.objects))
+    manifest = None if arguments.full else manifest_utils.Manifest(manifest_utils.Manifest.get_filepath(plan.base_folder))
+    plan.run(reporter, context, stages, arguments.order, manifest)
+    if manifest is not None:
+        manifest.save()
+    
+    result = {
+        'items': [{'name': item.name, 'path': str(item.path), 'success': item not in plan.failed_items} for item in plan.items],
+        'messages': reporter.messages,
+        'skipped_stages': manifest.skipped if manifest is not None else 0,
+        'validation': {level.lower() + 's': plan.validation.get_count(level) for level in ['ERROR', 'WARNING']} if plan.validation is not None else None,
+        'output': plan.output_stats.to_dict(),
+        'caches': {name: {'hits': hits, 'misses': misses} for name, (hits, misses) in plan.cache_stats.items()},
+    }
+    print(_RESULT_PREFIX + json.dumps(result))
+    return 1 if plan.failed_items else 0
+
+def main():
+    arguments = _get_arguments(_get_script_arguments())
+    if arguments.worker:
+        return _run_worker(arguments)
+    return _run_files(arguments)
+
+if __name__ == '__main__':
+    sys.exit(main())
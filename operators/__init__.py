@@ -7,9 +7,10 @@ from . import item
 from . import mesh
 from . import mesh_params
 from . import nadeo_import
+from . import validation
 from .all import (SCENE_OT_TrackmaniaExportAll,)
 from .copy import (SCENE_OT_TrackmaniaItemCopy, SCENE_OT_TrackmaniaItemPaste,)
-from .icon import (SCENE_OT_TrackmaniaExportIcon,)
+from .icon import (SCENE_OT_TrackmaniaExportIcon, SCENE_OT_TrackmaniaPreviewIcon,)
 from .item import (SCENE_OT_TrackmaniaExportItem,)
 from .mesh import (SCENE_OT_TrackmaniaExportMesh,)
 from .mesh_params import (SCENE_OT_TrackmaniaExportMeshParams,)
@@ -20,6 +21,7 @@ from .tools import (
     SCENE_OT_SelectUVLayer,
     SCENE_OT_CreateUVLayer,
     SCENE_OT_TrackmaniaImportDefaultMaterials,
+    SCENE_OT_TrackmaniaShowDefaultMaterialsReport,
     SCENE_OT_TrackmaniaCreateCustomMaterial,
     SCENE_OT_TrackmaniaAddDefaultMaterial,
     SCENE_OT_TrackmaniaCreateMissingUVLayers,
@@ -29,10 +31,12 @@ from .tools import (
     SCENE_OT_TrackmaniaCreateMaterialTestSet,
 )
 # special
-from ..properties.material import _get_trackmania_materials
+from ..properties import material as material_properties
+from ..utils import nadeo_importer
 
 # HACK
 from importlib import reload
+validation = reload(validation)
 all = reload(all)
 copy = reload(copy)
 icon = reload(icon)
@@ -46,6 +50,7 @@ tools = reload(tools)
 operators = [
     all.SCENE_OT_TrackmaniaExportAll,
     icon.SCENE_OT_TrackmaniaExportIcon,
+    icon.SCENE_OT_TrackmaniaPreviewIcon,
     item.SCENE_OT_TrackmaniaExportItem,
     copy.SCENE_OT_TrackmaniaItemCopy,
     copy.SCENE_OT_TrackmaniaItemPaste,
@@ -56,6 +61,7 @@ operators = [
     tools.SCENE_OT_SelectUVLayer,
     tools.SCENE_OT_CreateUVLayer,
     tools.SCENE_OT_TrackmaniaImportDefaultMaterials,
+    tools.SCENE_OT_TrackmaniaShowDefaultMaterialsReport,
     tools.SCENE_OT_TrackmaniaCreateCustomMaterial,
     tools.SCENE_OT_TrackmaniaAddDefaultMaterial,
     tools.SCENE_OT_TrackmaniaCreateMissingUVLayers,
@@ -66,7 +72,7 @@ operators = [
 ]
 
 def _get_custom_material_identifiers(self, context):
-    return [(identifier, identifier, '') for identifier in _get_trackmania_materials(context) if 'Custom' in identifier]
+    return material_properties.get_custom_identifier_items()
 
 def register():
     bpy.types.Scene.custom_material = bpy.props.EnumProperty(
@@ -79,7 +85,11 @@ def register():
     
     for operator in operators:
         bpy.utils.register_class(operator)
+    validation.register()
 
 def unregister():
+    validation.unregister()
+    icon.clear_previews()
+    nadeo_importer.shutdown()
     for operator in operators[::-1]:
         bpy.utils.unregister_class(operator)
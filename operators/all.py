@@ -1,28 +1,117 @@
 import bpy
+import time
+from bpy.props import (BoolProperty, EnumProperty,)
 from . import (base, icon, item, mesh, mesh_params, nadeo_import,)
+from ..utils import manifest as manifest_utils
 
 # HACK reload
 import importlib
 base = importlib.reload(base)
 
+# Stages of a full export, in the order they must run for an item
+export_stages = [
+    mesh.export_mesh,
+    mesh_params.export_mesh_params,
+    icon.export_icon,
+    item.export_item,
+    nadeo_import.nadeo_import,
+]
+
 
 class SCENE_OT_TrackmaniaExportAll(base.SCENE_OT_TrackmaniaExportBase):
     bl_idname = 'trackmania.export_all'
     bl_label = 'Trackmania Export'
     bl_description = 'Exports mesh, icon, and necessary xml files then import to trackmania.'
     
-    def export(self, context):
-        
-        success = False
+    order: EnumProperty(
+        name='Order',
+        items=(
+            ('ITEM', 'Per Item', 'Runs all export stages of an item before moving to the next item.'),
+            ('STAGE', 'Per Stage', 'Runs an export stage for all items before moving to the next stage.'),
+        ),
+        default='ITEM'
+    )
+    
+    incremental: BoolProperty(
+        name='Incremental',
+        description='Skips export stages whose inputs (meshes, materials, lights and item settings) did not change since their last successful export.',
+        default=True
+    )
+    
+    # Seconds of export work done per timer event before giving control back to Blender
+    step_budget = 0.05
+    
+    def get_stages(self):
+        return list(export_stages)
+    
+    def get_order(self):
+        return self.order
+    
+    def get_manifest(self, context, plan):
+        if not self.incremental:
+            return None
+        return manifest_utils.Manifest(manifest_utils.Manifest.get_filepath(plan.base_folder))
+    
+    # Runs the export from a timer so that Blender stays responsive, a few steps at a time. Esc cancels between steps,
+    # every step restoring the scene state it changed before returning.
+    def invoke(self, context, event):
+        self.begin_export(context)
+        window_manager = context.window_manager
+        window_manager.progress_begin(0, max(self.plan.step_count, 1))
+        self.timer = window_manager.event_timer_add(0.01, window=context.window)
+        window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+    
+    def modal(self, context, event):
         try:
-            bpy.ops.trackmania.export_mesh()
-            bpy.ops.trackmania.export_mesh_params()
-            bpy.ops.trackmania.export_icon()
-            bpy.ops.trackmania.export_item()
-            bpy.ops.trackmania.nadeo_import()
-            self.report({'INFO'}, 'Export succeeded.')
-            success = True
+            return self.step_modal(context, event)
         except Exception as e:
-            self.report({'ERROR'}, 'Failed to export: {}'.format(e))
+            self.report({'ERROR'}, 'Export failed: {}'.format(e))
+            # Failed while ending the export, nothing left to clean up
+            if self.timer is None:
+                return {'CANCELLED'}
+            self.stop_steps(context)
+            return self.end_modal(context, {'CANCELLED'})
+    
+    def step_modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self.report({'WARNING'}, 'Export cancelled after {} out of {} steps.'.format(self.plan.done_step_count, self.plan.step_count))
+            self.stop_steps(context)
+            return self.end_modal(context, {'CANCELLED'})
+        
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
         
-        return success
+        start = time.perf_counter()
+        while self.steps is not None and time.perf_counter() - start < self.step_budget:
+            if next(self.steps, None) is None:
+                self.steps = None
+        self.plan.collect(self, context, self.manifest)
+        if self.steps is None and not self.plan.pending:
+            return self.end_modal(context, {'FINISHED'})
+        
+        context.window_manager.progress_update(self.plan.done_step_count)
+        status = 'Trackmania Export: {} (Esc to cancel)'.format(self.plan.get_progress_text())
+        if self.steps is None:
+            status = 'Trackmania Export: waiting for {} imports (Esc to cancel)'.format(len(self.plan.pending))
+        context.workspace.status_text_set(status)
+        return {'RUNNING_MODAL'}
+    
+    # Stops remaining steps and background imports without waiting for running ones, so that ending the export doesn't
+    # block Blender
+    def stop_steps(self, context):
+        if self.steps is not None:
+            self.steps.close()
+            self.steps = None
+        self.plan.cancel()
+        self.plan.collect(self, context, self.manifest)
+        self.plan.abandon(self, context, self.manifest)
+    
+    def end_modal(self, context, result):
+        window_manager = context.window_manager
+        window_manager.event_timer_remove(self.timer)
+        self.timer = None
+        window_manager.progress_end()
+        context.workspace.status_text_set(None)
+        self.end_export(context)
+        return result
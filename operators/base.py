@@ -1,44 +1,81 @@
 import bpy
 from bpy.types import Operator
 from bpy.props import (EnumProperty, StringProperty)
+import concurrent.futures
 import pathlib
+from . import validation
+from ..utils import output
 from ..utils import preferences
+from ..properties import material as material_properties
 
-def _is_scene_collection(collection):
-    return any([scene.collection is collection for scene in bpy.data.scenes])
-
-def _get_scene(root_collection):
-    return next((scene for scene in bpy.data.scenes if scene.collection is root_collection), None)
-
-def _get_export_name(object_or_collection):
-    scene = _get_scene(object_or_collection)
-    if scene:
-        return scene.name
-    return object_or_collection.name
-
-def _get_parent_collection(collection):
-    for parent_collection in bpy.data.collections:
-        if collection.name in parent_collection.children.keys():
-            return parent_collection
-    for scene in bpy.data.scenes:
-        if collection.name in scene.collection.children.keys():
-            return scene.collection
-    return None
-
-def _get_item_settings(collection):
-    if collection is None:
-        return None
+# Parent / scene lookups of collections, built once per operator invocation instead of scanning all collections and
+# scenes for every lookup. Item settings, ancestries and paths are memoized, so resolving an item is O(depth).
+class CollectionHierarchy:
+    def __init__(self, blend_data):
+        self.parents = {}
+        self.scenes = {}
+        self.item_settings = {}
+        self.ancestries = {}
+        self.paths = {}
+        # Like previous lookups, a parent collection takes precedence over a scene's root collection
+        for parent_collection in blend_data.collections:
+            for collection in parent_collection.children:
+                self.parents.setdefault(collection, parent_collection)
+        for scene in blend_data.scenes:
+            self.scenes.setdefault(scene.collection, scene)
+            for collection in scene.collection.children:
+                self.parents.setdefault(collection, scene.collection)
+    
+    def is_scene_collection(self, collection):
+        return collection in self.scenes
     
-    if collection.trackmania_item.export_type == 'INHERIT':
-        return _get_item_settings(_get_parent_collection(collection))
+    def get_scene(self, root_collection):
+        return self.scenes.get(root_collection)
     
-    return collection.trackmania_item
+    def get_export_name(self, object_or_collection):
+        scene = self.get_scene(object_or_collection)
+        if scene:
+            return scene.name
+        return object_or_collection.name
+    
+    def get_parent_collection(self, collection):
+        return self.parents.get(collection)
+    
+    def get_item_settings(self, collection):
+        if collection is None:
+            return None
+        
+        if collection not in self.item_settings:
+            item_settings = collection.trackmania_item
+            if item_settings.export_type == 'INHERIT':
+                item_settings = self.get_item_settings(self.get_parent_collection(collection))
+            self.item_settings[collection] = item_settings
+        return self.item_settings[collection]
+    
+    def get_collection_ancestry(self, collection):
+        if collection is None:
+            return ()
+        
+        if collection not in self.ancestries:
+            self.ancestries[collection] = self.get_collection_ancestry(self.get_parent_collection(collection)) + (collection,)
+        return self.ancestries[collection]
     
-def _get_collection_items(objects):
+    def get_collection_path(self, collection):
+        if collection is None:
+            return pathlib.Path()
+        
+        if collection not in self.paths:
+            path = self.get_collection_path(self.get_parent_collection(collection))
+            if collection.trackmania_item.creates_folder:
+                path = path / self.get_export_name(collection)
+            self.paths[collection] = path
+        return self.paths[collection]
+
+def _get_collection_items(objects, hierarchy):
     collections = set()
     for object in objects:
         for collection in object.users_collection:
-            item_settings = _get_item_settings(collection)
+            item_settings = hierarchy.get_item_settings(collection)
             if item_settings and item_settings.export_type == 'SINGLE':
                 collections.add(collection)
     items = []
@@ -50,13 +87,13 @@ def _get_collection_items(objects):
         ))
     return items
 
-def _get_object_items(objects):
+def _get_object_items(objects, hierarchy):
     items = []
     for object in objects:
         if object.type not in ['MESH', 'LIGHT']:
             continue
         for collection in object.users_collection:
-            item_settings = _get_item_settings(collection)
+            item_settings = hierarchy.get_item_settings(collection)
             if item_settings and item_settings.export_type == 'MULTIPLE':
                 items.append((
                     collection,
@@ -66,54 +103,239 @@ def _get_object_items(objects):
     return items
 
 # (collection, main_object, objects)
-def _get_items(objects):
-    return _get_collection_items(objects) + _get_object_items(objects)
+def _get_items(objects, hierarchy):
+    return _get_collection_items(objects, hierarchy) + _get_object_items(objects, hierarchy)
 
-def _get_collection_ancestry(collection):
-    if collection is None:
-        return []
+# Everything stages need to export an item, resolved once when the export plan is built
+class ExportItem:
+    def __init__(self, plan, collection, main_object, objects, settings, path):
+        self.plan = plan
+        self.collection = collection
+        self.main_object = main_object
+        self.objects = objects
+        self.settings = settings
+        self.path = path
+        # Input hashes (see utils.manifest), computed on demand
+        self.input_hashes = {}
+    
+    @property
+    def output_stats(self):
+        return self.plan.output_stats
+    
+    @property
+    def name(self):
+        return self.path.name
+    
+    @property
+    def mesh_path(self):
+        return (self.path.parents[0] / 'Mesh' / self.path.name).with_suffix('.fbx')
     
-    return _get_collection_ancestry(_get_parent_collection(collection)) + [collection]
+    @property
+    def mesh_params_path(self):
+        return (self.path.parents[0] / 'Mesh' / self.path.name).with_suffix('.MeshParams.xml')
+    
+    @property
+    def icon_path(self):
+        return self.path.parents[0] / 'Icon' / self.path.name
+    
+    @property
+    def item_xml_path(self):
+        return self.path.with_suffix('.Item.xml')
+    
+    # Some stages rely on bpy operators (fbx export, render) that read the selection from context
+    def get_override(self, context):
+        override = context.copy()
+        override['collection'] = self.collection
+        override['active_object'] = self.main_object
+        override['selected_objects'] = self.objects
+        return override
+    
+    def run(self, operator, context, stage):
+        with context.temp_override(**self.get_override(context)):
+            try:
+                return stage(operator, context, self)
+            except Exception as e:
+                operator.report({'ERROR'}, 'Failed to export {}: {}'.format(self.name, e))
+                return False
 
-def _to_path(ancestry):
-    if not ancestry:
-        return pathlib.Path()
+# Items to export with their objects, settings and paths. Built once per export and shared by all its stages.
+class ExportPlan:
+    def __init__(self, context, objects):
+        self.hierarchy = CollectionHierarchy(context.blend_data)
+        self.base_folder = pathlib.Path(preferences.get(context).user_dir) / 'Work' / 'Items'
+        
+        self.output_stats = output.OutputStats()
+        self.sessions = {}
+        # Cache name: [hits, misses]
+        self.cache_stats = {}
+        self.items = []
+        for collection, main_object, item_objects in _get_items(objects, self.hierarchy):
+            settings = self.hierarchy.get_item_settings(collection)
+            path = self.base_folder / self.hierarchy.get_collection_path(collection)
+            if settings.export_type == 'MULTIPLE':
+                path = path / main_object.name
+            self.items.append(ExportItem(self, collection, main_object, item_objects, settings, path))
+        
+        self.failed_items = set()
+        self.validation = None
+        self.pending = {}
+        self.stage_counts = {}
+        self.step_count = 0
+        self.done_step_count = 0
+    
+    # State shared by all items of a stage (e.g. render settings), created by the first item needing it and kept until
+    # the plan is closed
+    def get_session(self, key, create):
+        if key not in self.sessions:
+            self.sessions[key] = create()
+        return self.sessions[key]
+    
+    def count_cache(self, name, hit):
+        stats = self.cache_stats.setdefault(name, [0, 0])
+        stats[0 if hit else 1] += 1
+    
+    def get_cache_summary(self):
+        return ', '.join('{} cache: {} / {} hits ({:.0%})'.format(name, hits, hits + misses, hits / (hits + misses)) for name, (hits, misses) in self.cache_stats.items())
+    
+    def close(self):
+        for session in reversed(list(self.sessions.values())):
+            session.close()
+        self.sessions = {}
+    
+    def _record(self, context, item, stage_name, success, manifest):
+        if manifest is not None:
+            if success:
+                manifest.update(context, item, stage_name)
+            else:
+                manifest.invalidate(item, stage_name)
+        if not success:
+            self.failed_items.add(item)
+        return success
+    
+    # With a manifest, stages whose inputs didn't change since their last successful run are skipped
+    def _run_stage(self, operator, context, item, stage, manifest):
+        stage_name = stage.__name__
+        if manifest is not None and manifest.is_up_to_date(context, item, stage_name):
+            manifest.skipped = manifest.skipped + 1
+            return True
+        
+        result = item.run(operator, context, stage)
+        if isinstance(result, concurrent.futures.Future):
+            self.pending[result] = (item, stage_name)
+            return True
+        return self._record(context, item, stage_name, result, manifest)
+    
+    # Stages running in the background return a future resolving to a result with success and get_report(), those are
+    # reported as they complete
+    def collect(self, operator, context, manifest=None, wait=False):
+        if wait:
+            futures = concurrent.futures.as_completed(list(self.pending))
+        else:
+            futures = [future for future in self.pending if future.done()]
+        for future in futures:
+            item, stage_name = self.pending.pop(future)
+            try:
+                result = future.result()
+                operator.report(*result.get_report())
+                success = result.success
+            except Exception as e:
+                operator.report({'ERROR'}, 'Failed to export {}: {}'.format(item.name, e))
+                success = False
+            self._record(context, item, stage_name, success, manifest)
+    
+    # Cancels stages queued in the background that didn't start yet, running ones still complete
+    def cancel(self):
+        for future in list(self.pending):
+            if future.cancel():
+                item, stage_name = self.pending.pop(future)
+                self.failed_items.add(item)
+    
+    # Stops waiting for stages running in the background: they are reported as abandoned and recorded as failed, their
+    # processes finish on their own but their results are ignored
+    def abandon(self, operator, context, manifest=None):
+        for item, stage_name in self.pending.values():
+            operator.report({'WARNING'}, 'Abandoned {} of {}, it may still be running in the background.'.format(stage_name, item.name))
+            self._record(context, item, stage_name, False, manifest)
+        self.pending = {}
     
-    if not ancestry[-1].trackmania_item.creates_folder:
-        return _to_path(ancestry[:-1])
+    def get_progress_text(self):
+        return ', '.join('{} {}/{}'.format(stage_name, count, len(self.items)) for stage_name, count in self.stage_counts.items())
     
-    return _to_path(ancestry[:-1]) / _get_export_name(ancestry[-1])
+    # Yields after every (item, stage) step so that callers can run an export incrementally. order is either 'ITEM'
+    # (all stages of an item before the next item) or 'STAGE' (a stage for all items before the next stage). Once a
+    # stage failed for an item, following stages are skipped for that item. Items are validated first, those with
+    # validation errors are skipped entirely.
+    def iter_steps(self, operator, context, stages, order='ITEM', manifest=None):
+        self.validation = validation.validate(operator, context, self, stages)
+        self.stage_counts = {stage.__name__: 0 for stage in stages}
+        self.step_count = len(self.items) * len(stages)
+        if order == 'STAGE':
+            steps = [(item, stage) for stage in stages for item in self.items]
+        else:
+            steps = [(item, stage) for item in self.items for stage in stages]
+        return self._iter_steps(operator, context, steps, manifest)
+    
+    def _iter_steps(self, operator, context, steps, manifest):
+        for item, stage in steps:
+            if item not in self.failed_items:
+                self._run_stage(operator, context, item, stage, manifest)
+                self.collect(operator, context, manifest)
+            self.stage_counts[stage.__name__] = self.stage_counts[stage.__name__] + 1
+            self.done_step_count = self.done_step_count + 1
+            yield item, stage
+    
+    def run(self, operator, context, stages, order='ITEM', manifest=None):
+        try:
+            for _ in self.iter_steps(operator, context, stages, order, manifest):
+                pass
+        finally:
+            self.close()
+        self.collect(operator, context, manifest, wait=True)
+        return len(self.items) - len(self.failed_items)
 
 class SCENE_OT_TrackmaniaExportBase(Operator):
     
-    @staticmethod
-    def get_item_path(context):
-        base_folder = pathlib.Path(preferences.get(context).user_dir) / 'Work' / 'Items'
-
-        path = base_folder / _to_path(_get_collection_ancestry(context.collection))
-        item_settings = _get_item_settings(context.collection)
-        if item_settings.export_type == 'MULTIPLE':
-            if context.active_object is None:
-                return None
-            path = path / context.active_object.name
-        
-        return path
+    # Functions (operator, context, item) -> success run on every item of the plan, by default the operator's export.
+    # Operators running a single stage return its module level function, so that stage properties (e.g. needing
+    # validation, manifest inputs) apply.
+    def get_stages(self):
+        return [type(self).export]
     
-    def get_item_settings(self, context):
-        return _get_item_settings(context.collection)
+    def get_order(self):
+        return 'ITEM'
     
-    def execute(self, context):
-        items = _get_items(context.selected_objects)
-        success = 0
-        for item in items:
-            override = context.copy()
-            override['collection'] = item[0]
-            override['active_object'] = item[1]
-            override['selected_objects'] = item[2]
-            with context.temp_override(**override):
-                success = success + 1 if self.export(context) else success
+    # Manifest used to skip unchanged stages, None to always run them
+    def get_manifest(self, context, plan):
+        return None
+    
+    def begin_export(self, context):
+        material_properties.update_trackmania_materials(context)
+        self.plan = ExportPlan(context, context.selected_objects)
+        self.manifest = self.get_manifest(context, self.plan)
+        self.steps = self.plan.iter_steps(self, context, self.get_stages(), self.get_order(), self.manifest)
+    
+    def end_export(self, context):
+        self.plan.close()
+        self.plan.collect(self, context, self.manifest, wait=True)
         
-        if len(items) > 1:
-            self.report({'INFO'}, '{} out of {} items exported successfully.'.format(success, len(items)))
+        if self.plan.output_stats.written_files or self.plan.output_stats.skipped_files:
+            self.report({'INFO'}, self.plan.output_stats.get_summary())
+        if self.plan.cache_stats:
+            self.report({'INFO'}, self.plan.get_cache_summary() + '.')
+        if self.manifest is not None:
+            self.manifest.save()
+            if self.manifest.skipped:
+                self.report({'INFO'}, '{} unchanged export stages skipped.'.format(self.manifest.skipped))
+        if len(self.plan.items) > 1:
+            success = len(self.plan.items) - len(self.plan.failed_items)
+            self.report({'INFO'}, '{} out of {} items exported successfully.'.format(success, len(self.plan.items)))
+    
+    def execute(self, context):
+        self.begin_export(context)
+        try:
+            for _ in self.steps:
+                pass
+        finally:
+            self.end_export(context)
         
         return {'FINISHED'}
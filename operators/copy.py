@@ -20,7 +20,7 @@ class SCENE_OT_TrackmaniaItemPaste(Operator):
         'grid_vertical_offset', 'pivot_manual_switch', 'pivot_automatic_snap',
         'pivot_snap_distance', 'waypoint_type', 'scale', 'not_on_item', 'one_axis_rotation',
         'auto_rotation', 'icon_generate_camera', 'icon_camera_pitch', 'icon_camera_yaw',
-        'icon_generate_sun', 'icon_sun_color', 'icon_sun_offset_pitch', 'icon_sun_offset_yaw',
+        'icon_tight_framing', 'icon_generate_sun', 'icon_sun_color', 'icon_sun_offset_pitch', 'icon_sun_offset_yaw',
     ]
     
     def execute(self, context):
@@ -1,36 +1,58 @@
 import bpy
+import bpy.utils.previews
+import gpu
+from bpy.types import Operator
 from bpy.props import (BoolProperty, PointerProperty, StringProperty)
-import itertools
 import math
 import mathutils
+import numpy as np
+import time
 from . import base
+from ..utils import manifest
+from ..utils import output
 
 # HACK reload
 import importlib
 base = importlib.reload(base)
 
 
+def _transform_points(matrices, points):
+    # matrices: (n, 4, 4), points: (n, k, 3) -> (n, k, 3)
+    return np.einsum('nij,nkj->nki', matrices[:, :3, :3], points) + matrices[:, np.newaxis, :3, 3]
+
+# World space corners of objects' bounding boxes, (8 * len(objects), 3)
 def _get_objects_bounds(objects):
-    return [object.matrix_world @ mathutils.Vector(tuple(pos)) for object in objects for pos in object.bound_box]
-
-def _get_vectors_center(vectors):
-    lower = vectors[0].copy()
-    upper = vectors[0].copy()
-    for vector in vectors:
-        for i in range(len(vector)):
-            lower[i] = min(lower[i], vector[i])
-            upper[i] = max(upper[i], vector[i])
-    return (lower + upper) / 2
-
-def _inverse_matrix(matrix):
-    copy = matrix.copy()
-    copy.invert()
-    return copy
+    if not objects:
+        return np.empty((0, 3))
+    matrices = np.array([object.matrix_world for object in objects], dtype=np.float64)
+    corners = np.array([object.bound_box for object in objects], dtype=np.float64)
+    return _transform_points(matrices, corners).reshape(-1, 3)
+
+# World space positions of objects' evaluated vertices, for a tighter framing than bounding boxes
+def _get_objects_vertices(objects, depsgraph):
+    vertices = []
+    for object in objects:
+        mesh = object.evaluated_get(depsgraph).data
+        positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', positions)
+        matrix = np.array(object.matrix_world, dtype=np.float64)
+        vertices.append(positions.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3])
+    if not vertices:
+        return np.empty((0, 3))
+    return np.concatenate(vertices)
+
+def _get_points_center(points):
+    return (points.min(axis=0) + points.max(axis=0)) / 2
+
+def _get_ortho_scale(camera_matrix_w, points_w):
+    matrix_v = np.array(camera_matrix_w.inverted(), dtype=np.float64)
+    points_v = points_w @ matrix_v[:3, :3].T + matrix_v[:3, 3]
+    return 2 * float(np.abs(points_v[:, :2]).max())
 
 def _offset_look_at(object, bounds_w, pitch, yaw):
-    center_position_w = _get_vectors_center(bounds_w)
+    center_position_w = mathutils.Vector(_get_points_center(bounds_w))
     center_matrix_w = mathutils.Matrix.Translation(center_position_w)
-    radius = max([bound.length for bound in bounds_w])
+    radius = float(np.linalg.norm(bounds_w, axis=1).max())
     object_position_c = mathutils.Matrix.Rotation(math.radians(yaw), 4, 'Z') \
         @ mathutils.Matrix.Rotation(math.radians(pitch), 4, 'Y') \
         @ mathutils.Vector((-1 - 2 * radius, 0, 0))
@@ -39,19 +61,101 @@ def _offset_look_at(object, bounds_w, pitch, yaw):
     object_matrix_w = center_matrix_w @ object_position_matrix_c @ object_look_at_matrix
     object.matrix_world = object_matrix_w
 
-class SCENE_OT_TrackmaniaExportIcon(base.SCENE_OT_TrackmaniaExportBase):
-    bl_idname = 'trackmania.export_icon'
-    bl_label = 'Trackmania Export Icon'
-    bl_description = 'Exports .tga icon of selected items.'
+# Inputs (see utils.manifest) an icon is rendered from, their hash is stored next to the icon
+_ICON_CACHE_INPUTS = ('meshes', 'materials', 'material_nodes', 'lights', 'icon_settings', 'icon_scene', 'camera')
+_ICON_CACHE_SALT = 'icon-1'
+_ICON_CACHE_KEY_SUFFIX = '.key'
+
+
+def _get_cache_key_path(tga_path):
+    return tga_path.with_name(tga_path.name + _ICON_CACHE_KEY_SUFFIX)
+
+def _read_cache_key(tga_path):
+    try:
+        return _get_cache_key_path(tga_path).read_text().strip()
+    except OSError:
+        return None
+
+# Scene settings copied to the scratch scene so that icons look like renders of the current scene, also hashed into
+# icon cache keys by utils.manifest
+_COPIED_SCENE_SETTINGS = manifest.ICON_SCENE_SETTINGS
+_COPY_SETTINGS_MAX_DEPTH = manifest.ICON_SCENE_SETTINGS_MAX_DEPTH
+
+
+def _copy_settings(source, target, depth=0):
+    for property in source.bl_rna.properties:
+        identifier = property.identifier
+        if identifier == 'rna_type':
+            continue
+        if property.type == 'POINTER':
+            # Nested settings (e.g. image settings), IDs are shared rather than copied
+            value = getattr(source, identifier, None)
+            if depth < _COPY_SETTINGS_MAX_DEPTH and value is not None and not isinstance(value, bpy.types.ID):
+                _copy_settings(value, getattr(target, identifier), depth + 1)
+            continue
+        if property.type == 'COLLECTION' or property.is_readonly:
+            continue
+        try:
+            setattr(target, identifier, getattr(source, identifier))
+        except (AttributeError, TypeError, ValueError):
+            pass
+
+# Renders icons in a scratch scene (created once per export, with the current scene's render settings) in which
+# only the objects of the rendered item are linked, so that the current scene is never modified. A single generated
+# camera and sun are reused and moved for each item. Everything is removed by close().
+class IconRenderer:
+    def __init__(self, scene):
+        self.source_scene = scene
+        self.camera_object = None
+        self.sun_object = None
+        self.linked_objects = []
+        
+        # 1> Create scratch scene
+        self.scene = bpy.data.scenes.new('Trackmania Icon')
+        for settings in _COPIED_SCENE_SETTINGS:
+            if hasattr(scene, settings):
+                _copy_settings(getattr(scene, settings), getattr(self.scene, settings))
+        self.scene.world = scene.world
+        self.scene.render.resolution_x = 64
+        self.scene.render.resolution_y = 64
+        self.scene.render.resolution_percentage = 100
+        self.scene.render.film_transparent = True
+        self.scene.render.image_settings.file_format = 'TARGA'
     
-    save: BoolProperty(name='Save', default=True)
+    # 2> Create generated camera / sun the first time an item needs them
+    def _get_camera_object(self):
+        if self.camera_object is None:
+            camera = bpy.data.cameras.new('Camera')
+            camera.type = 'ORTHO'
+            self.camera_object = bpy.data.objects.new('Camera', camera)
+            self.scene.collection.objects.link(self.camera_object)
+        return self.camera_object
+    
+    def _get_sun_object(self):
+        if self.sun_object is None:
+            sun_light = bpy.data.lights.new('Sun', type='SUN')
+            sun_light.energy = 3
+            self.sun_object = bpy.data.objects.new('Sun', sun_light)
+            self.scene.collection.objects.link(self.sun_object)
+        return self.sun_object
     
-    def export(self, context):
-        scene = context.scene
-        objects = context.selected_objects
-        item_settings = self.get_item_settings(context)
-        item_path = base.SCENE_OT_TrackmaniaExportBase.get_item_path(context)
-        path = item_path.parents[0] / 'Icon' / item_path.name
+    # 3> Link objects to render in the scratch scene, instead of hiding every other object of the file
+    def _link_objects(self, objects):
+        collection_objects = self.scene.collection.objects
+        for object in self.linked_objects:
+            collection_objects.unlink(object)
+        self.linked_objects = []
+        for object in objects:
+            if object.name not in collection_objects:
+                collection_objects.link(object)
+                self.linked_objects.append(object)
+    
+    # Places camera, sun and item's objects in the scratch scene. Returns meshes rendered on icon even though hidden
+    # (whose visibility must be restored after render), None if item can't be rendered.
+    def _setup_item(self, operator, context, item):
+        scene = self.scene
+        objects = item.objects
+        item_settings = item.settings
         
         # Calculate visible bounds for generated camera and sun
         bounds_w = None
@@ -60,108 +164,289 @@ class SCENE_OT_TrackmaniaExportIcon(base.SCENE_OT_TrackmaniaExportBase):
             for object in objects:
                 if not object.hide_render and object.type == 'MESH':
                     visible_objects.append(object)
-            bounds_w = _get_objects_bounds(visible_objects)
-            if not bounds_w:
-                self.report({'ERROR'}, 'No visible objects to point generated camera and sun at.')
-                return False
+            if item_settings.icon_tight_framing:
+                bounds_w = _get_objects_vertices(visible_objects, context.evaluated_depsgraph_get())
+            else:
+                bounds_w = _get_objects_bounds(visible_objects)
+            if not len(bounds_w):
+                operator.report({'ERROR'}, 'No visible objects to point generated camera and sun at.')
+                return None
         
         # Ensure we will have a camera to render with
-        if not item_settings.icon_generate_camera and not scene.camera:
-            self.report({'ERROR'}, 'No existing camera to render icon and generated camera is not enabled.')
-            return False
+        source_camera = self.source_scene.camera
+        if not item_settings.icon_generate_camera and not source_camera:
+            operator.report({'ERROR'}, 'No existing camera to render icon and generated camera is not enabled.')
+            return None
         
-        # 1> Save/Update current render settings
-        old_scene_render_resolution_x = scene.render.resolution_x
-        old_scene_render_resolution_y = scene.render.resolution_y
-        old_scene_render_film_transparent = scene.render.film_transparent
-        old_scene_render_image_settings_file_format = scene.render.image_settings.file_format
-        
-        scene.render.resolution_x = 64
-        scene.render.resolution_y = 64
-        scene.render.film_transparent = True
-        scene.render.image_settings.file_format = 'TARGA'
+        # Meshes are rendered depending on their Trackmania settings, other objects (lights) on their own visibility
+        rendered_objects = []
+        for object in objects:
+            if object.type != 'MESH' or object.data.trackmania_mesh.render_on_icon:
+                rendered_objects.append(object)
         
-        # 2> Create custom camera
-        custom_camera_object = None
+        # Place generated camera / Select camera
         if item_settings.icon_generate_camera:
-            custom_camera = bpy.data.cameras.new('Camera')
-            custom_camera.type = 'ORTHO'
-            camera_object = bpy.data.objects.new('Camera', custom_camera)
-            scene.collection.objects.link(camera_object)
+            camera_object = self._get_camera_object()
             _offset_look_at(camera_object, bounds_w, item_settings.icon_camera_pitch, item_settings.icon_camera_yaw)
-            item_matrix_v = _inverse_matrix(camera_object.matrix_world)
-            bounds_v = [item_matrix_v @ vector for vector in bounds_w]
-            custom_camera.ortho_scale = 2 * max(itertools.chain((abs(pos.x) for pos in bounds_v), (abs(pos.y) for pos in bounds_v)))
-            custom_camera_object = camera_object
-        
-        # 3> Save/Update camera
-        old_scene_camera = scene.camera
-        scene.camera = custom_camera_object if custom_camera_object else scene.camera
+            camera_object.data.ortho_scale = _get_ortho_scale(camera_object.matrix_world, bounds_w)
+            scene.camera = camera_object
+        else:
+            rendered_objects.append(source_camera)
+            scene.camera = source_camera
+        self._link_objects(rendered_objects)
         
-        # 4> Save/Update objects visibility
-        old_visible_invisible_objects = []
-        for object in objects:
-            if object.type == 'MESH' and not object.hide_render and not object.data.trackmania_mesh.render_on_icon:
-                old_visible_invisible_objects.append(object)
-                object.hide_render = True
-            if object.type == 'MESH' and object.hide_render and object.data.trackmania_mesh.render_on_icon:
-                old_visible_invisible_objects.append(object)
-                object.hide_render = False
-        for object in bpy.data.objects:
-            if object not in objects and not object.hide_render:
-                old_visible_invisible_objects.append(object)
-                object.hide_render = True
-        
-        # 5> Create custom sun
-        custom_sun_object = None
+        # Place generated sun / Hide it
+        if self.sun_object is not None:
+            self.sun_object.hide_render = not item_settings.icon_generate_sun
         if item_settings.icon_generate_sun:
-            sun_light = bpy.data.lights.new('Sun', type='SUN')
-            sun_light.energy = 3
-            sun_light.color = item_settings.icon_sun_color
-            custom_sun_object = bpy.data.objects.new('Sun', sun_light)
-            scene.collection.objects.link(custom_sun_object)
+            sun_object = self._get_sun_object()
+            sun_object.data.color = item_settings.icon_sun_color
             _offset_look_at(
-                custom_sun_object,
+                sun_object,
                 bounds_w,
                 item_settings.icon_camera_pitch + item_settings.icon_sun_offset_pitch,
                 item_settings.icon_camera_yaw + item_settings.icon_sun_offset_yaw)
         
-        # 6> Save/Update render path
-        old_scene_render_filepath = scene.render.filepath
-        scene.render.filepath = str(path)
+        # Save/Update visibility of meshes rendered on icon even though hidden
+        hidden_objects = [object for object in rendered_objects if object.type == 'MESH' and object.hide_render]
+        for object in hidden_objects:
+            object.hide_render = False
+        return hidden_objects
+    
+    def render(self, operator, context, item, save=True):
+        path = item.icon_path
+        tga_path = path.with_name(path.name + '.tga')
+        
+        # Reuse existing icon if it was rendered from the same inputs
+        cache_key = None
+        if save:
+            cache_key = manifest.get_inputs_hash(context, item, _ICON_CACHE_INPUTS, _ICON_CACHE_SALT)
+            cache_hit = tga_path.is_file() and _read_cache_key(tga_path) == cache_key
+            item.plan.count_cache('Icon', cache_hit)
+            if cache_hit:
+                operator.report({'INFO'}, 'Icon {}.tga is up to date.'.format(path.name))
+                return True
+        
+        hidden_objects = self._setup_item(operator, context, item)
+        if hidden_objects is None:
+            return False
+        
+        # Update render path
+        temp_path = output.get_temp_path(tga_path)
+        self.scene.render.filepath = str(temp_path)
         
         # Export
         success = False
         try:
             path.parents[0].mkdir(parents=True, exist_ok=True)
-            bpy.ops.render.render(write_still=self.save)
-            self.report({'INFO'}, 'Icon {}.tga exported successfully to {}.'.format(path.name, path.parents[0]))
+            bpy.ops.render.render(write_still=save, scene=self.scene.name)
+            if save:
+                output.commit(temp_path, tga_path, item.output_stats)
+                output.write_text(_get_cache_key_path(tga_path), cache_key, item.output_stats)
+            operator.report({'INFO'}, 'Icon {}.tga exported successfully to {}.'.format(path.name, path.parents[0]))
             success = True
         except Exception as e:
-            self.report({'ERROR'}, 'Failed to export icon {}.tga to {}: {}'.format(path.name, path.parents[0], e))
+            output.discard(temp_path)
+            operator.report({'ERROR'}, 'Failed to export icon {}.tga to {}: {}'.format(path.name, path.parents[0], e))
         
-        # 6< Restore render path
-        scene.render.filepath = old_scene_render_filepath
+        # Restore visibility
+        for object in hidden_objects:
+            object.hide_render = True
         
-        # 5< Destroy custom sun
-        if item_settings.icon_generate_sun:
-            bpy.data.objects.remove(custom_sun_object)
-        
-        # 4< Restore objects visibility
-        for object in old_visible_invisible_objects:
-            object.hide_render = not object.hide_render
-        
-        # 3< Restore previous camera
-        scene.camera = old_scene_camera
+        return success
+    
+    # Draws icon like the given 3D view would (Workbench when in solid shading) instead of rendering it, then returns
+    # its RGBA pixels (bottom row first, display space). Returns None if item can't be drawn.
+    def render_preview(self, operator, context, item, space, region):
+        hidden_objects = self._setup_item(operator, context, item)
+        if hidden_objects is None:
+            return None
         
-        # 2< Destroy custom camera
-        if item_settings.icon_generate_camera:
-            bpy.data.objects.remove(custom_camera_object)
+        offscreen = gpu.types.GPUOffScreen(64, 64)
+        try:
+            # View layer depsgraphs only exist once evaluated, evaluate the scratch scene like a window showing it would
+            view_layer = self.scene.view_layers[0]
+            with context.temp_override(scene=self.scene, view_layer=view_layer):
+                depsgraph = context.evaluated_depsgraph_get()
+            if depsgraph is None:
+                operator.report({'ERROR'}, 'Failed to evaluate icon scene of {}.'.format(item.name))
+                return None
+            camera_object = self.scene.camera
+            projection_matrix = camera_object.calc_matrix_camera(depsgraph, x=64, y=64)
+            offscreen.draw_view3d(
+                self.scene,
+                view_layer,
+                space,
+                region,
+                camera_object.matrix_world.inverted(),
+                projection_matrix,
+                do_color_management=True,
+                draw_background=False)
+            with offscreen.bind():
+                buffer = gpu.state.active_framebuffer_get().read_color(0, 0, 64, 64, 4, 0, 'FLOAT')
+            return np.array(buffer.to_list(), dtype=np.float32).ravel()
+        finally:
+            offscreen.free()
+            for object in hidden_objects:
+                object.hide_render = True
+    
+    def close(self):
+        # 3< Unlink rendered objects
+        self._link_objects([])
         
-        # 1< Restore previous render settings
-        scene.render.resolution_x = old_scene_render_resolution_x
-        scene.render.resolution_y = old_scene_render_resolution_y
-        scene.render.film_transparent = old_scene_render_film_transparent
-        scene.render.image_settings.file_format = old_scene_render_image_settings_file_format
+        # 2< Destroy generated sun and camera
+        if self.sun_object is not None:
+            sun_light = self.sun_object.data
+            bpy.data.objects.remove(self.sun_object)
+            bpy.data.lights.remove(sun_light)
+            self.sun_object = None
+        if self.camera_object is not None:
+            camera = self.camera_object.data
+            bpy.data.objects.remove(self.camera_object)
+            bpy.data.cameras.remove(camera)
+            self.camera_object = None
         
-        return success
+        # 1< Destroy scratch scene
+        bpy.data.scenes.remove(self.scene)
+
+def export_icon(operator, context, item, save=True):
+    renderer = item.plan.get_session((IconRenderer, context.scene), lambda: IconRenderer(context.scene))
+    return renderer.render(operator, context, item, save)
+
+# Icon previews, keyed by collection name. Requests are debounced: a preview is only drawn once settings stopped
+# changing for _PREVIEW_DELAY seconds (e.g. when done dragging a slider), a single draw per collection then.
+_PREVIEW_DELAY = 0.3
+
+_previews = None
+_preview_messages = {}
+_pending_previews = {}
+_preview_deadline = 0
+
+
+# Keeps the last error reported while rendering a preview, to be shown instead of it
+class _PreviewReporter:
+    def __init__(self):
+        self.message = None
+    
+    def report(self, type, message):
+        if 'ERROR' in type:
+            self.message = message
+
+def _get_previews():
+    global _previews
+    if _previews is None:
+        _previews = bpy.utils.previews.new()
+    return _previews
+
+# First 3D view's space and main region, which previews are drawn like
+def _get_view3d(windows):
+    for window in windows:
+        for area in window.screen.areas:
+            if area.type != 'VIEW_3D':
+                continue
+            for region in area.regions:
+                if region.type == 'WINDOW':
+                    return window, area.spaces.active, region
+    return None
+
+def _render_preview(context, collection, space, region):
+    plan = base.ExportPlan(context, list(collection.objects))
+    items = [item for item in plan.items if item.collection == collection]
+    if not items:
+        return None, 'No item to preview in this collection.'
+    item = next((item for item in items if item.main_object is not None and item.main_object == context.active_object), items[0])
+    
+    reporter = _PreviewReporter()
+    renderer = IconRenderer(context.scene)
+    try:
+        pixels = renderer.render_preview(reporter, context, item, space, region)
+    except Exception as e:
+        pixels = None
+        reporter.message = 'Failed to render icon preview: {}'.format(e)
+    finally:
+        renderer.close()
+    return pixels, reporter.message
+
+def _render_pending_previews():
+    remaining = _preview_deadline - time.monotonic()
+    if remaining > 0:
+        return remaining
+    
+    context = bpy.context
+    windows = context.window_manager.windows
+    collections = list(_pending_previews.values())
+    _pending_previews.clear()
+    view3d = _get_view3d(windows)
+    if view3d is None:
+        return None
+    window, space, region = view3d
+    with context.temp_override(window=window):
+        for collection in collections:
+            try:
+                key = collection.name
+            except ReferenceError:
+                # Collection was removed since request
+                continue
+            pixels, message = _render_preview(context, collection, space, region)
+            _preview_messages[key] = message
+            if pixels is not None:
+                preview = _get_previews().get(key) or _get_previews().new(key)
+                preview.image_size = (64, 64)
+                preview.image_pixels_float.foreach_set(pixels)
+    
+    for window in windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+    return None
+
+# Renders collection's icon preview once requests stop coming for a while, nothing is drawn without UI
+def request_preview(collection):
+    global _preview_deadline
+    if bpy.app.background:
+        return
+    _pending_previews[collection.name] = collection
+    _preview_deadline = time.monotonic() + _PREVIEW_DELAY
+    if not bpy.app.timers.is_registered(_render_pending_previews):
+        bpy.app.timers.register(_render_pending_previews, first_interval=_PREVIEW_DELAY)
+
+# Returns (preview icon id or None, error message or None)
+def get_preview(collection):
+    message = _preview_messages.get(collection.name)
+    if message is None and _previews is not None and collection.name in _previews:
+        return _previews[collection.name].icon_id, None
+    return None, message
+
+def clear_previews():
+    global _previews
+    if bpy.app.timers.is_registered(_render_pending_previews):
+        bpy.app.timers.unregister(_render_pending_previews)
+    _pending_previews.clear()
+    _preview_messages.clear()
+    if _previews is not None:
+        bpy.utils.previews.remove(_previews)
+        _previews = None
+
+
+class SCENE_OT_TrackmaniaExportIcon(base.SCENE_OT_TrackmaniaExportBase):
+    bl_idname = 'trackmania.export_icon'
+    bl_label = 'Trackmania Export Icon'
+    bl_description = 'Exports .tga icon of selected items.'
+    
+    save: BoolProperty(name='Save', default=True)
+    
+    def export(self, context, item):
+        return export_icon(self, context, item, save=self.save)
+
+class SCENE_OT_TrackmaniaPreviewIcon(Operator):
+    bl_idname = 'trackmania.preview_icon'
+    bl_label = 'Preview Icon'
+    bl_description = 'Draws a quick preview of collection\'s icon, without writing anything to disk.'
+    
+    @classmethod
+    def poll(cls, context):
+        return not bpy.app.background and context.collection is not None
+    
+    def execute(self, context):
+        request_preview(context.collection)
+        return {'FINISHED'}
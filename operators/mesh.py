@@ -1,72 +1,75 @@
 import bpy
+import contextlib
 from . import base
+from . import validation
+from ..utils import fbx_writer
+from ..utils import output
+from ..utils import preferences
 
 # HACK reload
 import importlib
 base = importlib.reload(base)
 
 
+# Objects keep their names, export names are only given to FBX writers
+def _get_export_names(item):
+    names = {}
+    for object in item.objects:
+        if object.type == 'MESH':
+            names[object] = object.data.trackmania_mesh.get_export_name(object.name)
+    return names
+
+# Blender's FBX exporter names objects with fbx_utils.get_blenderID_name, wrapping it gives objects their export
+# names in the file without renaming them in the scene
+@contextlib.contextmanager
+def _use_export_names(names):
+    from io_scene_fbx import fbx_utils
+    get_blenderID_name = fbx_utils.get_blenderID_name
+    def get_export_name(bid):
+        name = names.get(getattr(bid, 'original', bid)) if isinstance(bid, bpy.types.Object) else None
+        return name if name is not None else get_blenderID_name(bid)
+    
+    fbx_utils.get_blenderID_name = get_export_name
+    try:
+        yield
+    finally:
+        fbx_utils.get_blenderID_name = get_blenderID_name
+
+def _write_mesh_native(context, item, names):
+    data = fbx_writer.get_fbx_bytes(item.objects, names, context.evaluated_depsgraph_get(), context.scene.name)
+    output.write(item.mesh_path, data, item.output_stats)
+
+def _write_mesh_blender(context, item, names):
+    path = item.mesh_path
+    temp_path = output.get_temp_path(path)
+    try:
+        path.parents[0].mkdir(parents=True, exist_ok=True)
+        with _use_export_names(names):
+            bpy.ops.export_scene.fbx(filepath=str(temp_path), object_types={'MESH', 'LIGHT'}, axis_up='Y', use_selection=True)
+        output.commit(temp_path, path, item.output_stats)
+    except BaseException:
+        output.discard(temp_path)
+        raise
+
+# Materials and UV layers are checked by validation before stages run
+@validation.validated_stage
+def export_mesh(operator, context, item):
+    path = item.mesh_path
+    
+    write_mesh = _write_mesh_native if preferences.get(context).fbx_writer == 'NATIVE' else _write_mesh_blender
+    try:
+        write_mesh(context, item, _get_export_names(item))
+    except Exception as e:
+        operator.report({'ERROR'}, 'Failed to export mesh {} to {}: {}'.format(path.name, path.parents[0], e))
+        return False
+    operator.report({'INFO'}, 'Mesh {} exported to {}.'.format(path.name, path.parents[0]))
+    return True
+
+
 class SCENE_OT_TrackmaniaExportMesh(base.SCENE_OT_TrackmaniaExportBase):
     bl_idname = 'trackmania.export_mesh'
     bl_label = 'Trackmania Export Mesh'
     bl_description = 'Exports .fbx mesh of selected items.'
     
-    def export(self, context):
-        objects = context.selected_objects
-        item_settings = self.get_item_settings(context)
-        item_path = base.SCENE_OT_TrackmaniaExportBase.get_item_path(context)
-        path = (item_path.parents[0] / 'Mesh' / item_path.name).with_suffix('.fbx')
-        
-        # Ensure objects have enough UV layers
-        has_material_errors = False
-        for object in objects:
-            if object.type != 'MESH' or not object.data.trackmania_mesh.is_visible:
-                continue
-            
-            materials = [material for material in object.data.materials if material is not None]
-            if not materials:
-                self.report({'ERROR'}, 'Mesh {} is visible but has no materials.'.format(object.name))
-                has_material_errors = True
-                continue
-            
-            needs_base_material_uv = False
-            needs_lightmap_uv = False
-            for material in materials:
-                needs_base_material_uv = needs_base_material_uv or material.trackmania_material.needs_base_material_uv
-                needs_lightmap_uv = needs_lightmap_uv or material.trackmania_material.needs_lightmap_uv
-            
-            if needs_base_material_uv and 'BaseMaterial' not in object.data.uv_layers:
-                self.report({'ERROR'}, 'Mesh {} is missing a BaseMaterial UV layer.'.format(object.name))
-                has_material_errors = True
-            if needs_lightmap_uv and 'Lightmap' not in object.data.uv_layers:
-                self.report({'ERROR'}, 'Mesh {} is missing a Lightmap UV layer.'.format(object.name))
-                has_material_errors = True
-        if has_material_errors:
-            return False
-        
-        # 1> Save/Update special objects names
-        old_object_names = []
-        old_socket_start = context.blend_data.objects.get('_socket_start')
-        if old_socket_start is not None:
-            old_socket_start.name = 'old_socket_start'
-            old_object_names.append((old_socket_start, '_socket_start'))
-        for object in objects:
-            if object.type == 'MESH':
-                old_object_names.append((object, object.name))
-                object.name = object.data.trackmania_mesh.get_export_name(object.name)
-        
-        # Export
-        success = False
-        try:
-            path.parents[0].mkdir(parents=True, exist_ok=True)
-            bpy.ops.export_scene.fbx(filepath=str(path), object_types={'MESH', 'LIGHT'}, axis_up='Y', use_selection=True)
-            self.report({'INFO'}, 'Mesh {} exported to {}.'.format(path.name, path.parents[0]))
-            success = True
-        except Exception as e:
-            self.report({'ERROR'}, 'Failed to export mesh {} to {}: {}'.format(path.name, path.parents[0], e))
-        
-        # 1< Restore special objects names
-        for object_name in old_object_names:
-            object_name[0].name = object_name[1]
-        
-        return success
+    def get_stages(self):
+        return [export_mesh]
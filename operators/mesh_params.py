@@ -1,8 +1,10 @@
+import io
 import os
 import math
-from xml.etree import ElementTree as xml
-from xml.dom import minidom
 from . import base
+from . import validation
+from ..utils import output
+from ..utils import xml_writer
 
 # HACK reload
 import importlib
@@ -19,74 +21,79 @@ def _color_to_hex(color):
     return '{:02X}{:02X}{:02X}'.format(_gamma_correct(color.r), _gamma_correct(color.g), _gamma_correct(color.b))
 
 
+@validation.validated_stage
+def export_mesh_params(operator, context, item):
+    objects = item.objects
+    item_settings = item.settings
+    mesh_path = item.mesh_path
+    path = item.mesh_params_path
+    
+    # .1 Materials, sorted by name so that output doesn't depend on slot order
+    materials = {}
+    for object in objects:
+        for material_slot in object.material_slots:
+            material = material_slot.material
+            if material is not None:
+                materials[material.name] = material
+    
+    # .2 Lights
+    lights = [object for object in objects if object.type == 'LIGHT' and object.data.type in ['POINT', 'SPOT']]
+    
+    # Generate XML
+    stream = io.StringIO()
+    writer = xml_writer.XmlWriter(stream)
+    with writer.element('MeshParams', [
+        ('MeshType', 'Static'),
+        ('Collection', 'Stadium'),
+        ('Scale', str(item_settings.scale)),
+        ('FbxFile', os.path.relpath(str(mesh_path), path.parents[0])),
+    ]):
+        with writer.element('Materials'):
+            for name, material in sorted(materials.items()):
+                attributes = [
+                    ('Name', name),
+                    ('Link', material.trackmania_material.identifier),
+                    ('Color', _color_to_hex(material.trackmania_material.color)),
+                ]
+                if material.trackmania_material.gameplay != 'None':
+                    attributes.append(('GameplayId', str(material.trackmania_material.gameplay)))
+                if material.trackmania_material.physics != 'Default':
+                    attributes.append(('PhysicsId', str(material.trackmania_material.physics)))
+                writer.leaf('Material', attributes)
+        
+        with writer.element('Lights'):
+            for object in lights:
+                light = object.data
+                attributes = [
+                    ('sRGB', _color_to_hex(light.color)),
+                    ('Name', object.name),
+                    ('Intensity', str(light.energy)),
+                    ('Distance', str(light.distance)),
+                ]
+                if light.type == 'POINT':
+                    attributes.append(('Type', 'Point'))
+                else:
+                    attributes.append(('Type', 'Spot'))
+                    attributes.append(('SpotOuterAngle', str(math.degrees(light.spot_size))))
+                    attributes.append(('SpotInnerAngle', str(math.sqrt(1 - light.spot_blend) * math.degrees(light.spot_size))))
+                writer.leaf('Light', attributes)
+    
+    # Export
+    success = False
+    try:
+        output.write_text(path, stream.getvalue(), item.output_stats)
+        operator.report({'INFO'}, 'Mesh params {} exported to {}.'.format(path.name, path.parents[0]))
+        success = True
+    except Exception as e:
+        operator.report({'ERROR'}, 'Failed to export mesh params {} to {}: {}'.format(path.name, path.parents[0], e))
+    
+    return success
+
+
 class SCENE_OT_TrackmaniaExportMeshParams(base.SCENE_OT_TrackmaniaExportBase):
     bl_idname = 'trackmania.export_mesh_params'
     bl_label = 'Trackmania Export Mesh Params'
     bl_description = 'Exports .MeshParams.xml of selected items.'
     
-    def export(self, context):
-        objects = context.selected_objects
-        item_settings = self.get_item_settings(context)
-        item_path = base.SCENE_OT_TrackmaniaExportBase.get_item_path(context)
-        base_path = item_path.parents[0] / 'Mesh' / item_path.name
-        mesh_path = base_path.with_suffix('.fbx')
-        path = base_path.with_suffix('.MeshParams.xml')
-        
-        # Generate XML
-        xml_mesh_params = xml.Element('MeshParams')
-        xml_mesh_params.set('MeshType', 'Static')
-        xml_mesh_params.set('Collection', 'Stadium')
-        xml_mesh_params.set('Scale', str(item_settings.scale))
-        xml_mesh_params.set('FbxFile', os.path.relpath(str(mesh_path), path.parents[0]))
-        
-        # .1 Generate Materials section
-        xml_materials = xml.SubElement(xml_mesh_params, 'Materials')
-        materials = set()
-        for object in objects:
-            for material_slot in object.material_slots:
-                material = material_slot.material
-                if materials is not None:
-                    materials.add(material)
-        
-        for material in materials:
-            xml_material = xml.SubElement(xml_materials, 'Material')
-            xml_material.set('Name', material.name)
-            xml_material.set('Link', material.trackmania_material.identifier)
-            xml_material.set('Color', _color_to_hex(material.trackmania_material.color))
-            if material.trackmania_material.gameplay != 'None':
-                xml_material.set('GameplayId', str(material.trackmania_material.gameplay))
-            if material.trackmania_material.physics != 'Default':
-                xml_material.set('PhysicsId', str(material.trackmania_material.physics))
-            
-        # .2 Generate Lights section
-        xml_lights = xml.SubElement(xml_mesh_params, 'Lights')
-        for object in objects:
-            if object.type != 'LIGHT' or object.data.type not in ['POINT', 'SPOT']:
-                continue
-            
-            light = object.data
-            
-            xml_light = xml.SubElement(xml_lights, 'Light')
-            xml_light.set('sRGB', _color_to_hex(light.color))
-            xml_light.set('Name', object.name)
-            xml_light.set('Intensity', str(light.energy))
-            xml_light.set('Distance', str(light.distance))
-            if light.type == 'POINT':
-                xml_light.set('Type', 'Point')
-            else:
-                xml_light.set('Type', 'Spot')
-                xml_light.set('SpotOuterAngle', str(math.degrees(light.spot_size)))
-                xml_light.set('SpotInnerAngle', str(sqrt(1-light.spot_blend) * math.degrees(light.spot_size)))
-        
-        # Export
-        success = False
-        try:
-            path.parents[0].mkdir(parents=True, exist_ok=True)
-            file = open(str(path), 'w')
-            file.write(minidom.parseString(xml.tostring(xml_mesh_params)).toprettyxml())
-            self.report({'INFO'}, 'Mesh params {} exported to {}.'.format(path.name, path.parents[0]))
-            success = True
-        except Exception as e:
-            self.report({'ERROR'}, 'Failed to export mesh params {} to {}: {}'.format(path.name, path.parents[0], e))
-        
-        return success
+    def get_stages(self):
+        return [export_mesh_params]
@@ -1,7 +1,7 @@
-import os
 import pathlib
-import subprocess
 from . import base
+from . import validation
+from ..utils import nadeo_importer
 from ..utils import preferences
 
 # HACK reload
@@ -10,28 +10,23 @@ base = importlib.reload(base)
 preferences = importlib.reload(preferences)
 
 
+# Returns a future resolving to the ImportResult, so that importers of several items run concurrently
+@validation.validated_stage
+def nadeo_import(operator, context, item):
+    addon_preferences = preferences.get(context)
+    work_dir_path = pathlib.Path(addon_preferences.user_dir) / 'Work'
+    return nadeo_importer.submit(
+        addon_preferences.nadeo_importer_workers,
+        nadeo_importer.get_importer_command(addon_preferences.install_dir),
+        item.item_xml_path,
+        work_dir_path,
+        addon_preferences.nadeo_importer_timeout)
+
+
 class SCENE_OT_TrackmaniaNadeoImport(base.SCENE_OT_TrackmaniaExportBase):
     bl_idname = 'trackmania.nadeo_import'
     bl_label = 'Trackmania Nadeo Import'
     bl_description = 'Imports .Item.xml to Trackmania.'
     
-    def export(self, context):
-        objects = context.selected_objects
-        item_settings = self.get_item_settings(context)
-        path = base.SCENE_OT_TrackmaniaExportBase.get_item_path(context).with_suffix('.Item.xml')
-        
-        nadeo_importer_exe = str(pathlib.Path(preferences.get(context).install_dir, 'NadeoImporter.exe'))
-        work_dir_path = pathlib.Path(preferences.get(context).user_dir) / 'Work'
-        
-        # Import
-        success = False
-        try:
-            result = subprocess.check_output([nadeo_importer_exe, 'Item', os.path.relpath(str(path), work_dir_path)])
-            msg = result.decode('utf-8').split('\r\n', 1)[1].replace('\r', '')[:-1]
-            self.report({'INFO'}, 'Item imported successfully: ' + msg)
-            success = True
-        except Exception as e:
-            msg = e.output.decode('utf-8').split('\r\n', 1)[1].replace('\r', '')[:-1]
-            self.report({'ERROR'}, 'Error occured while importing item: ' + str(msg))
-        
-        return success
+    def get_stages(self):
+        return [nadeo_import]
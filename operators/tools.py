@@ -6,8 +6,10 @@ import numpy as np
 import os
 import pathlib
 import re
+from ..utils import cache as cache_utils
 from ..utils import textures as texture_utils
 from ..utils import preferences
+from ..properties import material as material_properties
 
 
 class SCENE_OT_SelectUVLayer(Operator):
@@ -119,7 +121,9 @@ def _get_default_material_textures(context):
     materials_filepath = pathlib.Path(prefs.install_dir) / 'NadeoImporterMaterialLib.txt'
     openplanet_extract_dir = pathlib.Path(prefs.openplanet_dir) / 'Extract'
     
-    return texture_utils.get_default_material_textures(materials_filepath, openplanet_extract_dir)
+    cache_filepath = cache_utils.get_filepath('default_material_textures.cache')
+    
+    return texture_utils.get_default_material_textures(materials_filepath, openplanet_extract_dir, cache_filepath)
 
 class SCENE_OT_TrackmaniaImportDefaultMaterials(Operator):
     bl_idname = 'trackmania.import_default_materials'
@@ -127,7 +131,7 @@ class SCENE_OT_TrackmaniaImportDefaultMaterials(Operator):
     bl_description = 'Imports default materials to be used for mesh-modeling.'
     
     def execute(self, context):
-        default_material_textures = _get_default_material_textures(context)
+        default_material_textures, report = _get_default_material_textures(context)
         material_import_count = 0
         for default_material_texture in default_material_textures:
             material_name = default_material_texture[0]
@@ -143,7 +147,23 @@ class SCENE_OT_TrackmaniaImportDefaultMaterials(Operator):
             
             material_import_count = material_import_count + 1
             
-        self.report({'INFO'}, '{} materials imported.'.format(material_import_count))
+        self.report({'INFO'}, '{} materials imported. {}'.format(material_import_count, report.get_summary()))
+        return {'FINISHED'}
+
+class SCENE_OT_TrackmaniaShowDefaultMaterialsReport(Operator):
+    bl_idname = 'trackmania.show_default_materials_report'
+    bl_label = 'Default Materials Report'
+    bl_description = 'Writes the report of how default materials were matched to textures (matches, ambiguities with keyword scores, timings) into a text datablock.'
+    
+    text_name = 'Trackmania Default Materials Report'
+    
+    def execute(self, context):
+        _, report = _get_default_material_textures(context)
+        
+        text = bpy.data.texts.get(self.text_name) or bpy.data.texts.new(self.text_name)
+        text.from_string(report.to_json())
+        
+        self.report({'INFO'}, '{} See text \'{}\'.'.format(report.get_summary(), text.name))
         return {'FINISHED'}
 
 class SCENE_OT_TrackmaniaCreateCustomMaterial(Operator):
@@ -153,7 +173,7 @@ class SCENE_OT_TrackmaniaCreateCustomMaterial(Operator):
     
     def execute(self, context):
         material_name = context.scene.custom_material
-        material_textures = _get_default_material_textures(context)
+        material_textures, _ = _get_default_material_textures(context)
         texture_filepath = next((mt[1] for mt in material_textures if mt[0] == material_name), None)
         if texture_filepath is None:
             self.report({'ERROR'}, 'Invalid custom material \'{}\''.format(material_name))
@@ -184,7 +204,7 @@ class SCENE_OT_TrackmaniaAddDefaultMaterial(Operator):
         # 1.3. Fallback to creating 'PlatformTech' material
         if not material:
             material_name = 'PlatformTech'
-            material_textures = _get_default_material_textures(context)
+            material_textures, _ = _get_default_material_textures(context)
             texture_filepath = next((mt[1] for mt in material_textures if mt[0] == material_name), None)
             image = bpy.data.images.load(str(texture_filepath), check_existing=True) if texture_filepath else None
             material = bpy.data.materials.new(name=material_name)
@@ -214,6 +234,7 @@ class SCENE_OT_TrackmaniaCreateMissingUVLayers(Operator):
     bl_description = 'Creates UV layers necessary for mesh to be imported into Trackmania.'
     
     def execute(self, context):
+        material_properties.update_trackmania_materials(context)
         objects = context.selected_objects
         
         new_uv_layer_count = 0
@@ -255,6 +276,7 @@ class SCENE_OT_TrackmaniaRemoveExtraUVLayers(Operator):
     bl_description = 'Removes UV layers unnecessary for mesh to be imported into Trackmania.'
     
     def execute(self, context):
+        material_properties.update_trackmania_materials(context)
         objects = context.selected_objects
         
         removed_uv_layer_count = 0
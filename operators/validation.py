@@ -0,0 +1,223 @@
+import bpy
+from bpy.app.handlers import persistent
+import numpy as np
+from ..utils import preferences
+from ..properties import material as material_properties
+
+_UV_LAYER_NAMES = ('BaseMaterial', 'Lightmap')
+# Faces smaller than this (in square meters) are reported as zero-area
+_MIN_FACE_AREA = 1e-10
+
+# Session uid of mesh (or of object, when it has modifiers): (signature, _MeshAnalysis), kept between exports and
+# dropped when the depsgraph reports a geometry update of the datablock
+_analyses = {}
+
+
+def _get_array(collection, attribute, dtype, size=1):
+    array = np.empty(len(collection) * size, dtype=dtype)
+    collection.foreach_get(attribute, array)
+    return array
+
+# Corner data is stored as attributes in recent Blender versions, much faster to read than loops
+def _get_corner_array(mesh, attribute_name, attribute):
+    mesh_attribute = mesh.attributes.get(attribute_name)
+    if mesh_attribute is not None:
+        return _get_array(mesh_attribute.data, 'value', np.int32)
+    return _get_array(mesh.loops, attribute, np.int32)
+
+def _get_uvs(uv_layer):
+    if hasattr(uv_layer, 'uv'):
+        return _get_array(uv_layer.uv, 'vector', np.float32, 2)
+    return _get_array(uv_layer.data, 'uv', np.float32, 2)
+
+# Marks stages (operator, context, item) -> success that need items to be validated before they run, e.g. stages
+# exporting meshes or materials
+def validated_stage(stage):
+    stage.needs_validation = True
+    return stage
+
+# Cheap to read, catches changes the depsgraph doesn't report as geometry updates (e.g. renamed UV layer)
+def _get_signature(mesh):
+    return (len(mesh.vertices), len(mesh.edges), len(mesh.loops), len(mesh.polygons), tuple(uv_layer.name for uv_layer in mesh.uv_layers))
+
+# Everything checks need to know about an (evaluated) mesh, computed once per mesh datablock
+class _MeshAnalysis:
+    def __init__(self, mesh):
+        polygon_count = len(mesh.polygons)
+        loop_vertices = _get_corner_array(mesh, '.corner_vert', 'vertex_index')
+        loop_starts = _get_array(mesh.polygons, 'loop_start', np.int32)
+        self.vertex_count = len(mesh.vertices)
+        self.triangle_count = len(loop_vertices) - 2 * polygon_count
+        
+        # Faces using a vertex twice in a row, then faces without area
+        next_loops = np.arange(1, len(loop_vertices) + 1)
+        if polygon_count:
+            next_loops[np.append(loop_starts[1:], len(loop_vertices)) - 1] = loop_starts
+        repeated_vertices = (loop_vertices == loop_vertices[next_loops]).astype(np.int32)
+        degenerate_faces = np.add.reduceat(repeated_vertices, loop_starts) > 0 if polygon_count else np.zeros(0, dtype=bool)
+        self.degenerate_face_count = int(np.count_nonzero(degenerate_faces))
+        areas = _get_array(mesh.polygons, 'area', np.float32)
+        self.zero_area_face_count = int(np.count_nonzero((areas <= _MIN_FACE_AREA) & ~degenerate_faces))
+        
+        # Edges not shared by exactly two faces: loose (no face), boundary (one face) or shared by more than two faces
+        loop_edges = _get_corner_array(mesh, '.corner_edge', 'edge_index')
+        edge_face_counts = np.bincount(loop_edges, minlength=len(mesh.edges))
+        self.loose_edge_count = int(np.count_nonzero(edge_face_counts == 0))
+        self.boundary_edge_count = int(np.count_nonzero(edge_face_counts == 1))
+        self.shared_edge_count = int(np.count_nonzero(edge_face_counts > 2))
+        
+        material_indices = _get_array(mesh.polygons, 'material_index', np.int32)
+        self.used_material_indices = np.unique(material_indices).tolist()
+        
+        # UV layers whose UVs are all the same (e.g. never unwrapped)
+        self.uv_layer_names = [uv_layer.name for uv_layer in mesh.uv_layers]
+        self.empty_uv_layer_names = []
+        for uv_layer in mesh.uv_layers:
+            uvs = _get_uvs(uv_layer).reshape(-1, 2)
+            if len(uvs) and (uvs.min(axis=0) == uvs.max(axis=0)).all():
+                self.empty_uv_layer_names.append(uv_layer.name)
+
+# Problems found by validation, with the items they make fail
+class ValidationReport:
+    def __init__(self):
+        # (level, item or None, message)
+        self.problems = []
+        self.failed_items = set()
+    
+    def add(self, level, item, message):
+        self.problems.append((level, item, message))
+        if level == 'ERROR':
+            self.failed_items.add(item)
+    
+    def get_count(self, level):
+        return sum(problem[0] == level for problem in self.problems)
+    
+    def get_summary(self, item_count):
+        return 'Validation: {} error(s), {} warning(s), {} out of {} items cannot be exported.'.format(
+            self.get_count('ERROR'), self.get_count('WARNING'), len(self.failed_items), item_count)
+    
+    def report(self, operator, item_count):
+        for level, item, message in self.problems:
+            operator.report({level}, '{}: {}'.format(item.name, message) if item is not None else message)
+        if self.problems:
+            operator.report({'ERROR'} if self.failed_items else {'WARNING'}, self.get_summary(item_count))
+
+class _Validator:
+    def __init__(self, context, plan, report):
+        self.plan = plan
+        self.report = report
+        self.depsgraph = context.evaluated_depsgraph_get()
+        self.trackmania_materials = material_properties.get_trackmania_materials()
+        addon_preferences = preferences.get(context)
+        self.max_vertex_count = addon_preferences.max_vertex_count
+        self.max_triangle_count = addon_preferences.max_triangle_count
+    
+    # Objects sharing a mesh without modifiers share its analysis
+    def get_analysis(self, object):
+        key = object.session_uid if object.modifiers else object.data.session_uid
+        mesh = object.evaluated_get(self.depsgraph).data
+        signature = _get_signature(mesh)
+        cached = _analyses.get(key)
+        hit = cached is not None and cached[0] == signature
+        self.plan.count_cache('validation', hit)
+        if not hit:
+            cached = (signature, _MeshAnalysis(mesh))
+            _analyses[key] = cached
+        return cached[1]
+    
+    def validate_materials(self, item, object, analysis):
+        material_slots = object.material_slots
+        materials = [material_slot.material for material_slot in material_slots if material_slot.material is not None]
+        if not materials:
+            self.report.add('ERROR', item, 'mesh {} is visible but has no materials.'.format(object.name))
+            return
+        empty_slot_count = sum(index >= len(material_slots) or material_slots[index].material is None for index in analysis.used_material_indices)
+        if empty_slot_count:
+            self.report.add('ERROR', item, 'mesh {} has faces using {} empty material slot(s).'.format(object.name, empty_slot_count))
+        
+        # Identifiers and needed UV layers come from the library, see validate()
+        if not self.trackmania_materials:
+            return
+        for material in materials:
+            if material.trackmania_material.identifier not in self.trackmania_materials:
+                self.report.add('ERROR', item, 'material {} of mesh {} has no valid Trackmania identifier.'.format(material.name, object.name))
+        
+        needed_uv_layer_names = set()
+        for material in materials:
+            if material.trackmania_material.needs_base_material_uv:
+                needed_uv_layer_names.add('BaseMaterial')
+            if material.trackmania_material.needs_lightmap_uv:
+                needed_uv_layer_names.add('Lightmap')
+        for uv_layer_name in _UV_LAYER_NAMES:
+            if uv_layer_name in needed_uv_layer_names and uv_layer_name not in analysis.uv_layer_names:
+                self.report.add('ERROR', item, 'mesh {} is missing a {} UV layer.'.format(object.name, uv_layer_name))
+            elif uv_layer_name in needed_uv_layer_names and uv_layer_name in analysis.empty_uv_layer_names:
+                self.report.add('WARNING', item, 'UV layer {} of mesh {} is empty (all UVs are the same).'.format(uv_layer_name, object.name))
+        extra_uv_layer_names = [name for name in analysis.uv_layer_names if name not in needed_uv_layer_names]
+        if extra_uv_layer_names:
+            self.report.add('WARNING', item, 'mesh {} has extra UV layer(s): {}.'.format(object.name, ', '.join(extra_uv_layer_names)))
+    
+    def validate_geometry(self, item, object, analysis):
+        if analysis.degenerate_face_count:
+            self.report.add('WARNING', item, 'mesh {} has {} degenerate face(s).'.format(object.name, analysis.degenerate_face_count))
+        if analysis.zero_area_face_count:
+            self.report.add('WARNING', item, 'mesh {} has {} zero-area face(s).'.format(object.name, analysis.zero_area_face_count))
+        non_manifold_edge_count = analysis.loose_edge_count + analysis.boundary_edge_count + analysis.shared_edge_count
+        if non_manifold_edge_count:
+            self.report.add('WARNING', item, 'mesh {} has {} non-manifold edge(s): {} loose, {} boundary, {} shared by more than two faces.'.format(
+                object.name, non_manifold_edge_count, analysis.loose_edge_count, analysis.boundary_edge_count, analysis.shared_edge_count))
+    
+    def validate_item(self, item):
+        vertex_count = 0
+        triangle_count = 0
+        for object in item.objects:
+            if object.type != 'MESH':
+                continue
+            analysis = self.get_analysis(object)
+            vertex_count = vertex_count + analysis.vertex_count
+            triangle_count = triangle_count + analysis.triangle_count
+            if object.data.trackmania_mesh.is_visible:
+                self.validate_materials(item, object, analysis)
+            self.validate_geometry(item, object, analysis)
+        
+        if self.max_vertex_count and vertex_count > self.max_vertex_count:
+            self.report.add('WARNING', item, '{} vertices, more than {}.'.format(vertex_count, self.max_vertex_count))
+        if self.max_triangle_count and triangle_count > self.max_triangle_count:
+            self.report.add('WARNING', item, '{} triangles, more than {}.'.format(triangle_count, self.max_triangle_count))
+
+# Checks all items of the plan in one pass, before any stage runs, when stages export meshes or materials. Items with
+# errors are marked as failed so that no stage runs for them. Returns the report (None when validation didn't run).
+def validate(operator, context, plan, stages):
+    if not any(getattr(stage, 'needs_validation', False) for stage in stages):
+        return None
+    
+    report = ValidationReport()
+    validator = _Validator(context, plan, report)
+    # An empty library (e.g. Trackmania install directory not set) would make every identifier invalid
+    if not validator.trackmania_materials:
+        report.add('WARNING', None, 'Trackmania materials not found ({}), material identifiers and UV layers not checked.'.format(
+            material_properties.get_trackmania_materials_filepath(context)))
+    for item in plan.items:
+        validator.validate_item(item)
+    plan.failed_items.update(report.failed_items)
+    report.report(operator, len(plan.items))
+    return report
+
+@persistent
+def _on_depsgraph_update(scene, depsgraph):
+    for update in depsgraph.updates:
+        if update.is_updated_geometry:
+            _analyses.pop(update.id.original.session_uid, None)
+
+@persistent
+def _on_load(*args):
+    _analyses.clear()
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(_on_depsgraph_update)
+    bpy.app.handlers.load_post.append(_on_load)
+
+def unregister():
+    bpy.app.handlers.load_post.remove(_on_load)
+    bpy.app.handlers.depsgraph_update_post.remove(_on_depsgraph_update)
+    _analyses.clear()
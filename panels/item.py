@@ -174,9 +174,17 @@ class VIEW3D_PT_TrackmaniaItemIcon(Panel):
         if item_settings.icon_generate_camera:
             layout.prop(item_settings, 'icon_camera_pitch')
             layout.prop(item_settings, 'icon_camera_yaw')
+            layout.prop(item_settings, 'icon_tight_framing')
         if item_settings.icon_generate_sun:
             layout.prop(item_settings, 'icon_sun_color')
             layout.prop(item_settings, 'icon_sun_offset_pitch')
             layout.prop(item_settings, 'icon_sun_offset_yaw')
+        
+        icon_id, message = operators.icon.get_preview(context.collection)
+        if icon_id is not None:
+            layout.template_icon(icon_value=icon_id, scale=4)
+        elif message is not None:
+            layout.label(text=message, icon='ERROR')
+        layout.operator(operators.SCENE_OT_TrackmaniaPreviewIcon.bl_idname, icon='FILE_REFRESH')
 
 
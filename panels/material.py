@@ -1,5 +1,6 @@
 import bpy
 from bpy.types import Panel
+from ..properties import material as material_properties
 
 
 class MATERIAL_PT_TrackmaniaMaterial(Panel):
@@ -16,8 +17,10 @@ class MATERIAL_PT_TrackmaniaMaterial(Panel):
     
     def draw(self, context):
         layout = self.layout
+        material_properties.update_trackmania_materials(context)
         material_settings = context.material.trackmania_material
         
+        layout.prop(material_settings, 'identifier_search', text='', icon='VIEWZOOM')
         layout.prop(material_settings, 'identifier')
         required_uv_layers = []
         if material_settings.needs_base_material_uv:
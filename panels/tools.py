@@ -1,6 +1,7 @@
 import bpy
 from bpy.types import Panel
 from .. import operators
+from ..properties import material as material_properties
 
 # HACK reload
 import importlib
@@ -27,8 +28,11 @@ class VIEW3D_PT_TrackmaniaToolsMaterials(Panel):
     
     def draw(self, context):
         layout = self.layout
+        material_properties.update_trackmania_materials(context)
         
-        layout.operator(operators.SCENE_OT_TrackmaniaImportDefaultMaterials.bl_idname)
+        row = layout.row()
+        row.operator(operators.SCENE_OT_TrackmaniaImportDefaultMaterials.bl_idname)
+        row.operator(operators.SCENE_OT_TrackmaniaShowDefaultMaterialsReport.bl_idname, text='', icon='TEXT')
         layout.prop(context.scene, 'custom_material')
         layout.operator(operators.SCENE_OT_TrackmaniaCreateCustomMaterial.bl_idname)
         layout.prop_search(context.scene, 'default_material', bpy.data, 'materials', text='Default Material')
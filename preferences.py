@@ -1,3 +1,4 @@
+import getpass
 import os
 
 import bpy
@@ -7,8 +8,12 @@ from bpy.types import (
 )
 
 from bpy.props import (
-    StringProperty
+    EnumProperty,
+    FloatProperty,
+    IntProperty,
+    StringProperty,
 )
+from .utils import registry
 
 class TrackmaniaAddonPreferences(AddonPreferences):
     bl_idname = __name__.split('.')[0]
@@ -17,7 +22,7 @@ class TrackmaniaAddonPreferences(AddonPreferences):
         name='Trackmania Install Directory',
         description='Where Trackmania and NadeoImporter are installed (usually: C:/Program Files (x86)/Ubisoft/Ubisoft Game Launcher/games/Trackmania).',
         subtype='DIR_PATH',
-        default=str(Path(os.environ['ProgramFiles(x86)'], 'Ubisoft/Ubisoft Game Launcher/games/Trackmania')),
+        default=str(Path(os.environ.get('ProgramFiles(x86)', 'C:/Program Files (x86)'), 'Ubisoft/Ubisoft Game Launcher/games/Trackmania')),
     )
     
     user_dir: StringProperty(
@@ -37,7 +42,46 @@ class TrackmaniaAddonPreferences(AddonPreferences):
     author_name: StringProperty(
         name='Author Name',
         description='Author name used when exporting items.',
-        default=os.getlogin(),
+        default=getpass.getuser(),
+    )
+    
+    nadeo_importer_workers: IntProperty(
+        name='NadeoImporter Workers',
+        description='How many NadeoImporter processes can run at the same time when importing several items.',
+        default=min(4, os.cpu_count() or 1),
+        min=1,
+        max=32,
+    )
+    
+    nadeo_importer_timeout: FloatProperty(
+        name='NadeoImporter Timeout',
+        description='Seconds after which a NadeoImporter process is killed and its item reported as failed (0 to never time out).',
+        default=300,
+        min=0,
+    )
+    
+    fbx_writer: EnumProperty(
+        name='FBX Writer',
+        description='How item meshes are written to .fbx files.',
+        items=(
+            ('BLENDER', 'Blender', 'Blender\'s FBX exporter.'),
+            ('NATIVE', 'Native', 'Dedicated writer for what NadeoImporter reads, faster.'),
+        ),
+        default='BLENDER',
+    )
+    
+    max_vertex_count: IntProperty(
+        name='Max Vertices',
+        description='Validation warns about items with more vertices than this (0 for no limit).',
+        default=65535,
+        min=0,
+    )
+    
+    max_triangle_count: IntProperty(
+        name='Max Triangles',
+        description='Validation warns about items with more triangles than this (0 for no limit).',
+        default=65535,
+        min=0,
     )
     
     def draw(self, context):
@@ -46,6 +90,18 @@ class TrackmaniaAddonPreferences(AddonPreferences):
         layout.prop(self, 'user_dir')
         layout.prop(self, 'openplanet_dir')
         layout.prop(self, 'author_name')
+        row = layout.row()
+        row.prop(self, 'nadeo_importer_workers')
+        row.prop(self, 'nadeo_importer_timeout')
+        layout.prop(self, 'fbx_writer')
+        row = layout.row()
+        row.prop(self, 'max_vertex_count')
+        row.prop(self, 'max_triangle_count')
+        
+        box = layout.box()
+        box.label(text='Caches')
+        for name, stats in registry.get_stats().items():
+            box.label(text='{}: {} hits, {} misses, {} reloads'.format(name, stats['hits'], stats['misses'], stats['reloads']))
 
 def register():
     bpy.utils.register_class(TrackmaniaAddonPreferences)
@@ -123,7 +123,10 @@ class COLLECTION_PG_TrackmaniaItem(PropertyGroup):
     )
     # Icon
     def update_icon_settings(self, context):
-        pass #TODO: bpy.ops.trackmania.render_icon(force_default_camera=True, save=False)
+        # Debounced, a single preview is rendered once settings stop changing. Imported here since operators import
+        # properties.
+        from ..operators import icon
+        icon.request_preview(self.id_data)
     
     icon_generate_camera: BoolProperty(
         name='Generate Camera',
@@ -143,6 +146,12 @@ class COLLECTION_PG_TrackmaniaItem(PropertyGroup):
         default=45,
         update=update_icon_settings
     )
+    icon_tight_framing: BoolProperty(
+        name='Tight Framing',
+        description='If set, generated camera and sun are framed on evaluated vertices instead of bounding boxes (closer fit for rotated or irregular meshes, slower on heavy meshes).',
+        default=False,
+        update=update_icon_settings
+    )
     icon_generate_sun: BoolProperty(
         name='Generate Sun',
         description='If set, will add a sun to the scene before generating Item\'s Icon.',
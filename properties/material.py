@@ -1,8 +1,7 @@
 import bpy
 from bpy.types import PropertyGroup
-from bpy.props import (BoolProperty, EnumProperty, FloatVectorProperty, PointerProperty)
+from bpy.props import (BoolProperty, EnumProperty, FloatVectorProperty, PointerProperty, StringProperty)
 
-import functools
 import pathlib
 import re
 
@@ -14,28 +13,78 @@ from importlib import reload
 preferences = reload(preferences)
 
 
-@functools.lru_cache(maxsize=1)
-def _get_trackmania_materials(context):
-    install_dir = preferences.get(context).install_dir
-    filepath = pathlib.Path(install_dir) / 'NadeoImporterMaterialLib.txt'
+_NO_TRACKMANIA_MATERIAL = material_utils.TrackmaniaMaterial('', False, False, False, False)
 
-    return material_utils.get_trackmania_materials(filepath)
+# (library filepath, {identifier: TrackmaniaMaterial}) of the library currently set in preferences
+_trackmania_materials = None
+
+def get_trackmania_materials_filepath(context):
+    return pathlib.Path(preferences.get(context).install_dir) / 'NadeoImporterMaterialLib.txt'
+
+# Resolves library from preferences and reloads it if it changed; cheap enough for panel draws and exports, not for property reads
+# (reading a dynamic enum like identifier calls its items callback)
+def update_trackmania_materials(context):
+    global _trackmania_materials
+    filepath = get_trackmania_materials_filepath(context)
+    try:
+        materials = material_utils.get_trackmania_materials(filepath)
+    except OSError as e:
+        print('WARNING: cannot read Trackmania materials from {}: {}'.format(filepath, e))
+        materials = {}
+    _trackmania_materials = (filepath, materials)
+    return materials
+
+def get_trackmania_materials():
+    if _trackmania_materials is None:
+        return update_trackmania_materials(bpy.context)
+    return _trackmania_materials[1]
+
+def get_trackmania_material(identifier):
+    return get_trackmania_materials().get(identifier, _NO_TRACKMANIA_MATERIAL)
+
+# Derived from the loaded library and rebuilt only when the registry reloads it (i.e. returns another dict). Enum items
+# must also stay referenced from python for as long as Blender may use them, which module level caches guarantee.
+_derived_caches = {}
+
+def _get_derived(name, build):
+    materials = get_trackmania_materials()
+    cached = _derived_caches.get(name)
+    if cached is None or cached[0] is not materials:
+        cached = (materials, build(materials))
+        _derived_caches[name] = cached
+    return cached[1]
+
+def get_identifier_items():
+    return _get_derived('identifier_items', lambda materials: [(identifier, identifier, '') for identifier in materials])
+
+def get_custom_identifier_items():
+    return _get_derived('custom_identifier_items', lambda materials: [
+        (identifier, identifier, '') for identifier, material in materials.items() if material.can_customize_color
+    ])
+
+def get_identifier_search_index():
+    return _get_derived('identifier_search_index', lambda materials: material_utils.MaterialSearchIndex(materials))
 
 class MATERIAL_PG_TrackmaniaMaterial(PropertyGroup):
     bl_idname = 'MATERIAL_PG_TrackmaniaMaterial'
 
     def _get_identifiers(self, context):
-        return [(identifier, identifier, '') for identifier in _get_trackmania_materials(context)]
+        return get_identifier_items()
+    
+    def _search_identifiers(self, context, edit_text):
+        return get_identifier_search_index().search(edit_text)
+    
+    def _update_identifier_search(self, context):
+        if self.identifier_search in get_trackmania_materials():
+            self.identifier = self.identifier_search
 
     @property
     def needs_base_material_uv(self):
-        trackmania_materials = _get_trackmania_materials(bpy.context)
-        return self.identifier in trackmania_materials and trackmania_materials[self.identifier].needs_base_material_uv
+        return get_trackmania_material(self.identifier).needs_base_material_uv
 
     @property
     def needs_lightmap_uv(self):
-        trackmania_materials = _get_trackmania_materials(bpy.context)
-        return self.identifier in trackmania_materials and trackmania_materials[self.identifier].needs_lightmap_uv
+        return get_trackmania_material(self.identifier).needs_lightmap_uv
 
     identifier: EnumProperty(
         items=_get_identifiers,
@@ -43,6 +92,13 @@ class MATERIAL_PG_TrackmaniaMaterial(PropertyGroup):
         description='A Trackmania material supported by NadeoImporter.',
         default=0,
     )
+    
+    identifier_search: StringProperty(
+        name='Search Identifier',
+        description='Search Trackmania materials by name (prefix or any part of it) and pick one as identifier.',
+        search=_search_identifiers,
+        update=_update_identifier_search,
+    )
 
     physics: EnumProperty(
         items=[(item[0], item[0], item[1]) for item in material_utils.get_physics_ids()],
@@ -53,8 +109,7 @@ class MATERIAL_PG_TrackmaniaMaterial(PropertyGroup):
 
     @property
     def can_customize_gameplay(self):
-        trackmania_materials = _get_trackmania_materials(bpy.context)
-        return self.identifier in trackmania_materials and trackmania_materials[self.identifier].can_customize_gameplay
+        return get_trackmania_material(self.identifier).can_customize_gameplay
 
     gameplay: EnumProperty(
         items=[(item[0], item[0], item[1]) for item in material_utils.get_gameplay_ids()],
@@ -65,8 +120,7 @@ class MATERIAL_PG_TrackmaniaMaterial(PropertyGroup):
 
     @property
     def can_customize_color(self):
-        trackmania_materials = _get_trackmania_materials(bpy.context)
-        return self.identifier in trackmania_materials and trackmania_materials[self.identifier].can_customize_color
+        return get_trackmania_material(self.identifier).can_customize_color
     
     def _update_color(self, context):
         node_tree = context.material.node_tree
@@ -0,0 +1,84 @@
+# Helpers for tests needing Blender: run them with Blender's python (or the bpy module), e.g.:
+#   python -m pytest tests
+# Tests using these helpers are skipped when bpy is not available.
+import importlib
+import pathlib
+import sys
+import tempfile
+import unittest
+
+try:
+    import bpy
+    import addon_utils
+except ImportError:
+    raise unittest.SkipTest('bpy is not available')
+
+ADDON_DIR = pathlib.Path(__file__).resolve().parents[1]
+ADDON_NAME = ADDON_DIR.name
+
+# Material library with a material needing both UV layers and one needing none
+_MATERIAL_LIBRARY = '''DLibrary(Stadium)
+\tDMaterial(PlatformTech)
+\t\tDUvLayer(BaseMaterial, 0)
+\t\tDUvLayer(Lightmap, 1)
+\t\tDGameplayId(None)
+\tDMaterial(Grass)
+\t\tDGameplayId(None)
+'''
+
+
+def import_addon_module(name):
+    return importlib.import_module(ADDON_NAME + '.' + name)
+
+# Empty factory scene with the add-on enabled, install / user directories in a temporary directory (removed by the
+# returned object's cleanup())
+def setup_scene():
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    if str(ADDON_DIR.parent) not in sys.path:
+        sys.path.append(str(ADDON_DIR.parent))
+    addon_utils.enable(ADDON_NAME, default_set=True)
+    
+    temp_dir = tempfile.TemporaryDirectory()
+    install_dir = pathlib.Path(temp_dir.name) / 'install'
+    install_dir.mkdir()
+    (install_dir / 'NadeoImporterMaterialLib.txt').write_text(_MATERIAL_LIBRARY)
+    addon_preferences = bpy.context.preferences.addons[ADDON_NAME].preferences
+    addon_preferences.install_dir = str(install_dir)
+    addon_preferences.user_dir = str(pathlib.Path(temp_dir.name) / 'user')
+    import_addon_module('properties.material').update_trackmania_materials(bpy.context)
+    return temp_dir
+
+# Collection exported as a single item
+def new_item_collection(name='Item'):
+    collection = bpy.data.collections.new(name)
+    bpy.context.scene.collection.children.link(collection)
+    collection.trackmania_item.export_type = 'SINGLE'
+    return collection
+
+# Cube (24 loops) with the given UV layers and materials (by Trackmania identifier)
+def new_cube(collection, name='Cube', uv_layer_names=('BaseMaterial', 'Lightmap'), identifiers=('PlatformTech',)):
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(
+        [(x, y, z) for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)],
+        [],
+        [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)])
+    for index, uv_layer_name in enumerate(uv_layer_names):
+        uv_layer = mesh.uv_layers.new(name=uv_layer_name)
+        for loop in mesh.loops:
+            uv_layer.data[loop.index].uv = ((loop.vertex_index + index) % 4 / 4, loop.index / len(mesh.loops))
+    for identifier in identifiers:
+        material = bpy.data.materials.new('{}{}'.format(name, identifier))
+        material.trackmania_material.identifier = identifier
+        mesh.materials.append(material)
+    object = bpy.data.objects.new(name, mesh)
+    collection.objects.link(object)
+    return object
+
+def get_item_mesh_path(collection):
+    plan = import_addon_module('operators.base').ExportPlan(bpy.context, list(collection.objects))
+    return plan.items[0].mesh_path
+
+def select_only(objects):
+    bpy.context.view_layer.update()
+    for object in bpy.context.view_layer.objects:
+        object.select_set(object in objects)
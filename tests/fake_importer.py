@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# Stand-in for NadeoImporter.exe, for trying the export pipeline without Trackmania, e.g.:
+#   TRACKMANIA_NADEO_IMPORTER="python3 tests/fake_importer.py" blender
+# Called with the same `Item <path>` arguments. Like NadeoImporter it prints a banner line then what happened, on
+# '\r\n' line endings. Items whose name contains 'bad' fail, those containing 'slow' take 10 times longer (case insensitive).
+# TRACKMANIA_FAKE_IMPORTER_DELAY sets how long an import takes (seconds, 0.3 by default).
+import os
+import sys
+import time
+
+
+def main(arguments):
+    sys.stdout.write('NadeoImporter (stand-in)\r\n')
+    if len(arguments) != 2 or arguments[0] != 'Item':
+        sys.stdout.write('ERROR: expected arguments: Item <path>\r\n')
+        return 2
+    
+    path = arguments[1]
+    name = os.path.basename(path).lower()
+    delay = float(os.environ.get('TRACKMANIA_FAKE_IMPORTER_DELAY', 0.3))
+    time.sleep(delay * 10 if 'slow' in name else delay)
+    if 'bad' in name:
+        sys.stdout.write('ERROR: cannot import {}\r\n'.format(path))
+        return 1
+    sys.stdout.write('Imported {}\r\n'.format(path))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,44 @@
+import contextlib
+import importlib.util
+import io
+import pathlib
+import unittest
+
+_CLI_PATH = pathlib.Path(__file__).resolve().parents[1] / 'cli.py'
+
+
+def _load_cli():
+    spec = importlib.util.spec_from_file_location('trackmania_cli', _CLI_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def export_mesh(): pass
+def export_mesh_params(): pass
+def export_icon(): pass
+def export_item(): pass
+def nadeo_import(): pass
+
+class StageSelectionTest(unittest.TestCase):
+    def setUp(self):
+        self.cli = _load_cli()
+    
+    def get_stages(self, stages, export_stages=(export_mesh, export_mesh_params, export_icon, export_item, nadeo_import)):
+        arguments = self.cli._get_arguments(['--stages', stages])
+        return self.cli._get_stages(list(export_stages), self.cli._get_stage_names(arguments))
+    
+    def test_selects_stages_by_name_in_export_order(self):
+        self.assertEqual(self.get_stages('item, mesh'), [export_mesh, export_item])
+        self.assertEqual(self.get_stages('nadeo_import,icon'), [export_icon, nadeo_import])
+    
+    def test_selection_does_not_depend_on_stage_positions(self):
+        self.assertEqual(self.get_stages('icon', [export_icon, export_mesh]), [export_icon])
+    
+    def test_rejects_unknown_stage_names(self):
+        with contextlib.redirect_stderr(io.StringIO()) as stderr, self.assertRaises(SystemExit):
+            self.cli._get_arguments(['--stages', 'mesh,meshes'])
+        self.assertIn('unknown export stage(s): meshes', stderr.getvalue())
+    
+    def test_rejects_missing_export_stages(self):
+        with self.assertRaises(ValueError):
+            self.get_stages('mesh,icon', [export_mesh])
@@ -0,0 +1,48 @@
+import concurrent.futures
+import unittest
+
+import blender_helpers
+import bpy
+
+
+class ExportPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = blender_helpers.setup_scene()
+        self.collection = blender_helpers.new_item_collection()
+        blender_helpers.new_cube(self.collection)
+        self.base = blender_helpers.import_addon_module('operators.base')
+        self.plan = self.base.ExportPlan(bpy.context, list(self.collection.objects))
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def test_abandons_running_stages(self):
+        item = self.plan.items[0]
+        running = concurrent.futures.Future()
+        running.set_running_or_notify_cancel()
+        self.plan.pending[running] = (item, 'nadeo_import')
+        reporter = _Reporter()
+        self.plan.cancel()
+        self.assertIn(running, self.plan.pending)
+        
+        self.plan.abandon(reporter, bpy.context)
+        self.assertFalse(self.plan.pending)
+        self.assertEqual(self.plan.failed_items, {item})
+        self.assertEqual(reporter.messages, [({'WARNING'}, 'Abandoned nadeo_import of Item, it may still be running in the background.')])
+        # Ending the export doesn't wait for abandoned stages
+        self.plan.collect(reporter, bpy.context, wait=True)
+        self.assertEqual(len(reporter.messages), 1)
+    
+    def test_cancels_queued_stages(self):
+        item = self.plan.items[0]
+        self.plan.pending[concurrent.futures.Future()] = (item, 'nadeo_import')
+        self.plan.cancel()
+        self.assertFalse(self.plan.pending)
+        self.assertEqual(self.plan.failed_items, {item})
+
+class _Reporter:
+    def __init__(self):
+        self.messages = []
+    
+    def report(self, type, message):
+        self.messages.append((type, message))
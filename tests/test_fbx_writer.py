@@ -0,0 +1,125 @@
+import re
+import unittest
+
+import blender_helpers
+import bpy
+import numpy as np
+
+
+# Imported datablocks get a numeric suffix when their name is already used
+def _get_base_name(name):
+    return re.sub(r'\.\d{3}$', '', name)
+
+def _get_array(collection, attribute, size):
+    array = np.empty(len(collection) * size, dtype=np.float64)
+    collection.foreach_get(attribute, array)
+    return array.reshape(-1, size)
+
+# Per-object world vertices, per-corner (world position, UV of every layer) and per-face material names, sorted so that
+# element order doesn't matter
+def _get_mesh_data(object, mesh):
+    matrix = np.array(object.matrix_world)
+    vertices = _get_array(mesh.vertices, 'co', 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    loop_vertices = _get_array(mesh.loops, 'vertex_index', 1).astype(np.int32).ravel()
+    corners = [np.round(vertices[loop_vertices], 4)]
+    for uv_layer in sorted(mesh.uv_layers, key=lambda uv_layer: uv_layer.name):
+        corners.append(np.round(_get_array(uv_layer.data, 'uv', 2), 4))
+    corners = np.hstack(corners)
+    materials = [_get_base_name(mesh.materials[polygon.material_index].name) if mesh.materials else None for polygon in mesh.polygons]
+    return {
+        'vertices': np.round(vertices[np.lexsort(vertices.T)], 4),
+        'corners': corners[np.lexsort(corners.T)],
+        'uv_layer_names': sorted(uv_layer.name for uv_layer in mesh.uv_layers),
+        'material_slots': sorted(_get_base_name(material.name) for material in mesh.materials),
+        'face_materials': sorted(materials),
+    }
+
+class FbxRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = blender_helpers.setup_scene()
+        self.collection = blender_helpers.new_item_collection()
+        self.object = blender_helpers.new_cube(self.collection, identifiers=('PlatformTech', 'Grass'))
+        self.object.location = (0.5, -1, 2)
+        self.object.rotation_euler = (0.3, 0.2, 1.0)
+        self.object.scale = (1, 2, 0.5)
+        self.object.data.polygons.foreach_set('material_index', [index % 2 for index in range(len(self.object.data.polygons))])
+        self.object.modifiers.new('Bevel', 'BEVEL').width = 0.1
+        self.addon_preferences = bpy.context.preferences.addons[blender_helpers.ADDON_NAME].preferences
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def export(self, fbx_writer):
+        self.addon_preferences.fbx_writer = fbx_writer
+        blender_helpers.select_only([self.object])
+        bpy.ops.trackmania.export_mesh()
+        path = blender_helpers.get_item_mesh_path(self.collection)
+        fbx_path = path.with_name('{}.{}.fbx'.format(path.stem, fbx_writer))
+        path.replace(fbx_path)
+        return fbx_path
+    
+    # Imports with the stock importer in a scene of its own, returns data of the imported mesh
+    def import_fbx(self, fbx_path):
+        scene = bpy.data.scenes.new(fbx_path.stem)
+        with bpy.context.temp_override(scene=scene, view_layer=scene.view_layers[0]):
+            bpy.ops.import_scene.fbx(filepath=str(fbx_path))
+        objects = [object for object in scene.objects if object.type == 'MESH']
+        self.assertEqual(len(objects), 1)
+        return _get_mesh_data(objects[0], objects[0].data)
+    
+    def assertMeshDataEqual(self, first, second):
+        self.assertEqual(first.keys(), second.keys())
+        for key in first:
+            if isinstance(first[key], np.ndarray):
+                self.assertEqual(first[key].shape, second[key].shape, key)
+                np.testing.assert_allclose(first[key], second[key], atol=1e-3, err_msg=key)
+            else:
+                self.assertEqual(first[key], second[key], key)
+    
+    def test_writers_round_trip_the_same_mesh(self):
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        expected = _get_mesh_data(self.object, self.object.evaluated_get(depsgraph).data)
+        blender_data = self.import_fbx(self.export('BLENDER'))
+        native_data = self.import_fbx(self.export('NATIVE'))
+        self.assertEqual(native_data['uv_layer_names'], ['BaseMaterial', 'Lightmap'])
+        self.assertEqual(native_data['material_slots'], ['CubeGrass', 'CubePlatformTech'])
+        self.assertMeshDataEqual(blender_data, expected)
+        self.assertMeshDataEqual(native_data, expected)
+
+class FbxExportNamesTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = blender_helpers.setup_scene()
+        self.collection = blender_helpers.new_item_collection()
+        self.objects = [blender_helpers.new_cube(self.collection, name=name) for name in ['Block', 'Spawn', 'Gate']]
+        self.objects[1].data.trackmania_mesh.mesh_type = 'SPAWN'
+        self.objects[2].data.trackmania_mesh.mesh_type = 'TRIGGER'
+        # Unrelated object already using the spawn's export name, renaming the spawn would give it another name
+        other = bpy.data.objects.new('_socket_start', None)
+        bpy.context.scene.collection.objects.link(other)
+        self.addon_preferences = bpy.context.preferences.addons[blender_helpers.ADDON_NAME].preferences
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def export(self, fbx_writer):
+        from io_scene_fbx import fbx_utils
+        get_blenderID_name = fbx_utils.get_blenderID_name
+        object_names = sorted(object.name for object in bpy.data.objects)
+        self.addon_preferences.fbx_writer = fbx_writer
+        blender_helpers.select_only(self.objects)
+        bpy.ops.trackmania.export_mesh()
+        self.assertEqual(sorted(object.name for object in bpy.data.objects), object_names)
+        self.assertIs(fbx_utils.get_blenderID_name, get_blenderID_name)
+        
+        path = blender_helpers.get_item_mesh_path(self.collection)
+        fbx_path = path.with_name('{}.{}.fbx'.format(path.stem, fbx_writer))
+        path.replace(fbx_path)
+        return fbx_path
+    
+    def test_writers_use_export_names(self):
+        fbx_paths = [self.export('BLENDER'), self.export('NATIVE')]
+        # Imported in an empty file so that imported names don't clash with scene names
+        for fbx_path in fbx_paths:
+            bpy.ops.wm.read_factory_settings(use_empty=True)
+            bpy.ops.import_scene.fbx(filepath=str(fbx_path))
+            self.assertEqual(sorted(object.name for object in bpy.data.objects), ['Block', '_socket_start', '_trigger_Gate'], fbx_path.name)
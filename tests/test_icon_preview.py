@@ -0,0 +1,21 @@
+import unittest
+
+import blender_helpers
+import bpy
+
+
+class IconPreviewTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = blender_helpers.setup_scene()
+        self.collection = blender_helpers.new_item_collection()
+        self.icon = blender_helpers.import_addon_module('operators.icon')
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    # Update callbacks run without operator context (e.g. from scripts), previews are only drawn with UI
+    def test_settings_updates_request_no_preview_in_background(self):
+        self.collection.trackmania_item.icon_camera_pitch = 30
+        self.collection.trackmania_item.icon_generate_sun = False
+        self.assertFalse(self.icon._pending_previews)
+        self.assertFalse(bpy.app.timers.is_registered(self.icon._render_pending_previews))
@@ -0,0 +1,42 @@
+import unittest
+
+import blender_helpers
+import bpy
+
+
+class ExportItemTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = blender_helpers.setup_scene()
+        self.collection = blender_helpers.new_item_collection()
+        blender_helpers.new_cube(self.collection)
+        self.base = blender_helpers.import_addon_module('operators.base')
+        self.item = blender_helpers.import_addon_module('operators.item')
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def run_export_item(self):
+        plan = self.base.ExportPlan(bpy.context, list(self.collection.objects))
+        reporter = _Reporter()
+        plan.run(reporter, bpy.context, [self.item.export_item])
+        return plan, reporter
+    
+    def test_exports_item_xml(self):
+        plan, reporter = self.run_export_item()
+        self.assertFalse(plan.failed_items)
+        self.assertTrue(plan.items[0].item_xml_path.is_file())
+    
+    def test_fails_when_item_xml_cannot_be_written(self):
+        plan = self.base.ExportPlan(bpy.context, list(self.collection.objects))
+        # A directory in place of the file makes writing it fail
+        plan.items[0].item_xml_path.mkdir(parents=True)
+        plan, reporter = self.run_export_item()
+        self.assertEqual(len(plan.failed_items), 1)
+        self.assertEqual([type for type, message in reporter.messages], [{'ERROR'}])
+
+class _Reporter:
+    def __init__(self):
+        self.messages = []
+    
+    def report(self, type, message):
+        self.messages.append((type, message))
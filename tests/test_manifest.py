@@ -0,0 +1,169 @@
+import concurrent.futures
+import json
+import os
+import pathlib
+import shlex
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import blender_helpers
+import bpy
+
+
+class ManifestSaveTest(unittest.TestCase):
+    def setUp(self):
+        self.manifest_utils = blender_helpers.import_addon_module('utils.manifest')
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filepath = self.manifest_utils.Manifest.get_filepath(self.temp_dir.name)
+        self.lock_filepath = self.filepath.with_name(self.filepath.name + '.lock')
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def save_item(self, item_path):
+        manifest = self.manifest_utils.Manifest(self.filepath)
+        manifest.items[item_path] = {'export_mesh': item_path}
+        manifest.changed_items.add(item_path)
+        manifest.save()
+    
+    def load_items(self):
+        return json.loads(self.filepath.read_text())['items']
+    
+    def test_concurrent_saves_keep_all_items(self):
+        item_paths = ['item{}'.format(index) for index in range(16)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(self.save_item, item_paths))
+        self.assertEqual(sorted(self.load_items()), sorted(item_paths))
+        self.assertFalse(self.lock_filepath.exists())
+    
+    def test_does_not_write_while_locked(self):
+        self.lock_filepath.parent.mkdir(parents=True, exist_ok=True)
+        self.lock_filepath.touch()
+        timeout = self.manifest_utils._LOCK_TIMEOUT
+        self.manifest_utils._LOCK_TIMEOUT = 0.2
+        try:
+            self.save_item('item')
+        finally:
+            self.manifest_utils._LOCK_TIMEOUT = timeout
+        self.assertFalse(self.filepath.exists())
+        self.assertTrue(self.lock_filepath.exists())
+    
+    def test_removes_stale_lock(self):
+        self.lock_filepath.parent.mkdir(parents=True, exist_ok=True)
+        self.lock_filepath.touch()
+        old = self.lock_filepath.stat().st_mtime - self.manifest_utils._LOCK_STALE_AGE - 1
+        os.utime(self.lock_filepath, (old, old))
+        self.save_item('item')
+        self.assertEqual(list(self.load_items()), ['item'])
+        self.assertFalse(self.lock_filepath.exists())
+
+class ManifestInputsTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = blender_helpers.setup_scene()
+        self.collection = blender_helpers.new_item_collection()
+        blender_helpers.new_cube(self.collection)
+        self.spawn = blender_helpers.new_cube(self.collection, name='Spawn')
+        self.spawn.data.trackmania_mesh.mesh_type = 'SPAWN'
+        self.base = blender_helpers.import_addon_module('operators.base')
+        self.item = blender_helpers.import_addon_module('operators.item')
+        self.manifest_utils = blender_helpers.import_addon_module('utils.manifest')
+        self.filepath = self.manifest_utils.Manifest.get_filepath(self.temp_dir.name)
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def get_plan(self):
+        return self.base.ExportPlan(bpy.context, list(self.collection.objects))
+    
+    def is_up_to_date(self, stage_name):
+        manifest = self.manifest_utils.Manifest(self.filepath)
+        return manifest.is_up_to_date(bpy.context, self.get_plan().items[0], stage_name)
+    
+    def get_input_hash(self, input):
+        return self.manifest_utils.get_input_hash(bpy.context, self.get_plan().items[0], input)
+    
+    def run_stages(self, stages):
+        manifest = self.manifest_utils.Manifest(self.filepath)
+        self.get_plan().run(_Reporter(), bpy.context, stages, manifest=manifest)
+        manifest.save()
+    
+    def test_item_xml_depends_on_socket_transform(self):
+        self.run_stages([self.item.export_item])
+        self.assertTrue(self.is_up_to_date('export_item'))
+        
+        self.spawn.location = (4, 0, 0)
+        bpy.context.view_layer.update()
+        self.assertFalse(self.is_up_to_date('export_item'))
+    
+    def test_camera_hash_survives_reload(self):
+        camera = bpy.data.objects.new('Camera', bpy.data.cameras.new('Camera'))
+        self.collection.objects.link(camera)
+        bpy.context.scene.camera = camera
+        self.collection.trackmania_item.icon_generate_camera = False
+        camera_hash = self.get_input_hash('camera')
+        
+        filepath = pathlib.Path(self.temp_dir.name) / 'item.blend'
+        bpy.ops.wm.save_as_mainfile(filepath=str(filepath))
+        bpy.ops.wm.open_mainfile(filepath=str(filepath))
+        self.collection = bpy.data.collections['Item']
+        self.assertEqual(self.get_input_hash('camera'), camera_hash)
+        
+        bpy.data.cameras['Camera'].lens = 35
+        self.assertNotEqual(self.get_input_hash('camera'), camera_hash)
+    
+    def test_icon_scene_covers_copied_settings_and_world(self):
+        scene = bpy.context.scene
+        scene.world = bpy.data.worlds.new('World')
+        scene.world.use_nodes = True
+        icon_scene_hash = self.get_input_hash('icon_scene')
+        
+        # Overridden by the icon renderer
+        scene.render.filepath = '//renders/'
+        scene.render.resolution_x = 1024
+        self.assertEqual(self.get_input_hash('icon_scene'), icon_scene_hash)
+        
+        scene.eevee.taa_render_samples = 3
+        samples_hash = self.get_input_hash('icon_scene')
+        self.assertNotEqual(samples_hash, icon_scene_hash)
+        
+        background = next(node for node in scene.world.node_tree.nodes if node.type == 'BACKGROUND')
+        background.inputs['Strength'].default_value = 2
+        self.assertNotEqual(self.get_input_hash('icon_scene'), samples_hash)
+    
+    # Exports every stage of the item, importing it with the stand-in importer
+    def export_all(self):
+        all = blender_helpers.import_addon_module('operators.all')
+        environment = {
+            'TRACKMANIA_NADEO_IMPORTER': shlex.join([sys.executable, str(pathlib.Path(__file__).with_name('fake_importer.py'))]),
+            'TRACKMANIA_FAKE_IMPORTER_DELAY': '0',
+        }
+        with mock.patch.dict(os.environ, environment):
+            self.run_stages(all.export_stages)
+        self.assertTrue(self.is_up_to_date('nadeo_import'))
+    
+    def test_import_depends_on_icon(self):
+        icon = blender_helpers.import_addon_module('operators.icon')
+        bpy.context.scene.render.engine = 'BLENDER_WORKBENCH'
+        self.export_all()
+        
+        self.collection.trackmania_item.icon_camera_pitch = 30
+        self.assertFalse(self.is_up_to_date('export_icon'))
+        self.run_stages([icon.export_icon])
+        self.assertFalse(self.is_up_to_date('nadeo_import'))
+    
+    # The FBX writer is no item setting, only the mesh file tells the import changed
+    def test_import_depends_on_mesh_file(self):
+        mesh = blender_helpers.import_addon_module('operators.mesh')
+        bpy.context.scene.render.engine = 'BLENDER_WORKBENCH'
+        self.export_all()
+        
+        bpy.context.preferences.addons[blender_helpers.ADDON_NAME].preferences.fbx_writer = 'NATIVE'
+        self.assertFalse(self.is_up_to_date('export_mesh'))
+        self.run_stages([mesh.export_mesh])
+        self.assertFalse(self.is_up_to_date('nadeo_import'))
+
+class _Reporter:
+    def report(self, type, message):
+        pass
@@ -0,0 +1,114 @@
+import importlib.util
+import os
+import pathlib
+import shlex
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+_ADDON_DIR = pathlib.Path(__file__).resolve().parents[1]
+_FAKE_IMPORTER_PATH = pathlib.Path(__file__).resolve().with_name('fake_importer.py')
+_DELAY = 0.5
+
+
+# Doesn't need bpy, loaded without the add-on package
+def _load_nadeo_importer():
+    spec = importlib.util.spec_from_file_location('trackmania_nadeo_importer', _ADDON_DIR / 'utils' / 'nadeo_importer.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class NadeoImporterTest(unittest.TestCase):
+    def setUp(self):
+        self.nadeo_importer = _load_nadeo_importer()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.work_dir_path = pathlib.Path(self.temp_dir.name) / 'Work'
+        self.importer_command = [sys.executable, str(_FAKE_IMPORTER_PATH)]
+        environment = mock.patch.dict(os.environ, {'TRACKMANIA_FAKE_IMPORTER_DELAY': str(_DELAY)})
+        environment.start()
+        self.addCleanup(environment.stop)
+    
+    def tearDown(self):
+        self.nadeo_importer.shutdown()
+        self.temp_dir.cleanup()
+    
+    def get_item_path(self, name):
+        return self.work_dir_path / 'Items' / '{}.Item.xml'.format(name)
+    
+    def submit(self, name, workers=4, timeout=None):
+        return self.nadeo_importer.submit(workers, self.importer_command, self.get_item_path(name), self.work_dir_path, timeout)
+    
+    def test_runs_imports_in_parallel(self):
+        start = time.perf_counter()
+        futures = [self.submit('Item{}'.format(index)) for index in range(4)]
+        results = [future.result() for future in futures]
+        duration = time.perf_counter() - start
+        self.assertTrue(all(result.success for result in results))
+        self.assertLess(duration, 4 * _DELAY)
+        self.assertEqual(results[0].get_report(), ({'INFO'}, 'Item imported successfully: Imported {}'.format(os.path.join('Items', 'Item0.Item.xml'))))
+    
+    def test_limits_imports_to_worker_count(self):
+        start = time.perf_counter()
+        futures = [self.submit('Item{}'.format(index), workers=2) for index in range(4)]
+        for future in futures:
+            future.result()
+        self.assertGreaterEqual(time.perf_counter() - start, 2 * _DELAY)
+    
+    def test_reports_failures(self):
+        results = [future.result() for future in [self.submit('Good'), self.submit('Bad')]]
+        self.assertTrue(results[0].success)
+        self.assertFalse(results[1].success)
+        self.assertEqual(results[1].returncode, 1)
+        self.assertEqual(results[1].get_report(), ({'ERROR'}, 'Error occured while importing item: ERROR: cannot import {}'.format(os.path.join('Items', 'Bad.Item.xml'))))
+    
+    def test_reports_timeouts(self):
+        result = self.submit('Slow', timeout=2 * _DELAY).result()
+        self.assertTrue(result.timed_out)
+        self.assertFalse(result.success)
+        self.assertEqual(result.get_report()[0], {'ERROR'})
+        self.assertIn('timed out', result.get_report()[1])
+    
+    def test_shutdown_does_not_wait_for_running_imports(self):
+        running = self.submit('Slow', workers=1)
+        queued = self.submit('Item', workers=1)
+        time.sleep(_DELAY / 2)
+        start = time.perf_counter()
+        self.nadeo_importer.shutdown()
+        self.assertLess(time.perf_counter() - start, _DELAY)
+        self.assertTrue(queued.cancelled())
+        self.assertFalse(running.cancelled())
+    
+    def test_reports_missing_importer(self):
+        result = self.nadeo_importer.run([str(pathlib.Path(self.temp_dir.name) / 'NadeoImporter.exe')], self.get_item_path('Item'), self.work_dir_path)
+        self.assertFalse(result.success)
+        self.assertEqual(result.get_report()[0], {'ERROR'})
+
+class ImporterCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.nadeo_importer = _load_nadeo_importer()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+    
+    def get_command(self, importer):
+        with mock.patch.dict(os.environ, {'TRACKMANIA_NADEO_IMPORTER': importer}):
+            return self.nadeo_importer.get_importer_command('install')
+    
+    def test_defaults_to_installed_importer(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('TRACKMANIA_NADEO_IMPORTER', None)
+            self.assertEqual(self.nadeo_importer.get_importer_command('install'), [str(pathlib.Path('install', 'NadeoImporter.exe'))])
+    
+    def test_keeps_importer_path_with_spaces(self):
+        importer_path = pathlib.Path(self.temp_dir.name) / 'Nadeo Importer' / 'fake importer.py'
+        importer_path.parent.mkdir()
+        shutil.copy(_FAKE_IMPORTER_PATH, importer_path)
+        self.assertEqual(self.get_command(str(importer_path)), [str(importer_path)])
+    
+    @unittest.skipIf(os.name == 'nt', 'POSIX shell quoting')
+    def test_splits_quoted_command_line(self):
+        importer_path = str(pathlib.Path(self.temp_dir.name) / 'Nadeo Importer' / 'fake importer.py')
+        command = self.get_command('{} {}'.format(shlex.quote(sys.executable), shlex.quote(importer_path)))
+        self.assertEqual(command, [sys.executable, importer_path])
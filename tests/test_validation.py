@@ -0,0 +1,98 @@
+import unittest
+
+import blender_helpers
+import bmesh
+import bpy
+
+
+class StandaloneMeshExportTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = blender_helpers.setup_scene()
+        self.collection = blender_helpers.new_item_collection()
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    # Returns whether the mesh was written and reported errors (bpy.ops raises them)
+    def export_mesh(self, object):
+        blender_helpers.select_only([object])
+        errors = ''
+        try:
+            bpy.ops.trackmania.export_mesh()
+        except RuntimeError as e:
+            errors = str(e)
+        return blender_helpers.get_item_mesh_path(self.collection).exists(), errors
+    
+    def test_exports_valid_mesh(self):
+        self.assertEqual(self.export_mesh(blender_helpers.new_cube(self.collection)), (True, ''))
+    
+    def test_rejects_mesh_without_materials(self):
+        exported, errors = self.export_mesh(blender_helpers.new_cube(self.collection, identifiers=()))
+        self.assertFalse(exported)
+        self.assertIn('mesh Cube is visible but has no materials', errors)
+    
+    def test_rejects_mesh_without_uv_layers(self):
+        exported, errors = self.export_mesh(blender_helpers.new_cube(self.collection, uv_layer_names=()))
+        self.assertFalse(exported)
+        self.assertIn('mesh Cube is missing a BaseMaterial UV layer', errors)
+        self.assertIn('mesh Cube is missing a Lightmap UV layer', errors)
+    
+    def test_rejects_mesh_missing_lightmap(self):
+        exported, errors = self.export_mesh(blender_helpers.new_cube(self.collection, uv_layer_names=('BaseMaterial',)))
+        self.assertFalse(exported)
+        self.assertIn('mesh Cube is missing a Lightmap UV layer', errors)
+
+class ValidationTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = blender_helpers.setup_scene()
+        self.collection = blender_helpers.new_item_collection()
+        self.base = blender_helpers.import_addon_module('operators.base')
+        self.mesh = blender_helpers.import_addon_module('operators.mesh')
+        self.validation = blender_helpers.import_addon_module('operators.validation')
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def validate(self):
+        plan = self.base.ExportPlan(bpy.context, list(self.collection.objects))
+        report = self.validation.validate(_Reporter(), bpy.context, plan, [self.mesh.export_mesh])
+        return plan, report
+    
+    def test_reports_boundary_edges(self):
+        object = blender_helpers.new_cube(self.collection)
+        plan, report = self.validate()
+        self.assertFalse(report.problems)
+        
+        # Open the cube
+        mesh = object.data
+        bm = bmesh.new()
+        bm.from_mesh(mesh)
+        bm.faces.ensure_lookup_table()
+        bmesh.ops.delete(bm, geom=[bm.faces[0]], context='FACES_ONLY')
+        bm.to_mesh(mesh)
+        bm.free()
+        plan, report = self.validate()
+        messages = [message for level, item, message in report.problems]
+        self.assertEqual(messages, ['mesh Cube has 4 non-manifold edge(s): 0 loose, 4 boundary, 0 shared by more than two faces.'])
+        self.assertFalse(plan.failed_items)
+    
+    def test_reuses_analyses_between_exports(self):
+        object = blender_helpers.new_cube(self.collection)
+        plan, report = self.validate()
+        self.assertEqual(plan.cache_stats['validation'], [0, 1])
+        plan, report = self.validate()
+        self.assertEqual(plan.cache_stats['validation'], [1, 0])
+        
+        # Geometry updates drop the analysis
+        object.data.vertices[0].co.x = -2
+        object.data.update()
+        bpy.context.view_layer.update()
+        plan, report = self.validate()
+        self.assertEqual(plan.cache_stats['validation'], [0, 1])
+
+class _Reporter:
+    def __init__(self):
+        self.messages = []
+    
+    def report(self, type, message):
+        self.messages.append((type, message))
@@ -0,0 +1,33 @@
+import bpy
+import os
+import pathlib
+import pickle
+
+
+def get_filepath(filename):
+    return pathlib.Path(bpy.utils.user_resource('DATAFILES', path='trackmania', create=True)) / filename
+
+def load(filepath, version, key):
+    try:
+        with open(filepath, 'rb') as file:
+            cache = pickle.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print('WARNING: ignoring unreadable cache {}: {}'.format(filepath, e))
+        return None
+    
+    if not isinstance(cache, dict) or cache.get('version') != version or cache.get('key') != key:
+        return None
+    return cache['data']
+
+def save(filepath, version, key, data):
+    filepath = pathlib.Path(filepath)
+    tmp_filepath = filepath.with_name(filepath.name + '.tmp')
+    try:
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_filepath, 'wb') as file:
+            pickle.dump({'version': version, 'key': key, 'data': data}, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filepath, filepath)
+    except OSError as e:
+        print('WARNING: failed to write cache {}: {}'.format(filepath, e))
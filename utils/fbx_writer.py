@@ -0,0 +1,420 @@
+import concurrent.futures
+import math
+import mathutils
+import numpy as np
+import struct
+import zlib
+
+# Binary FBX 7.4 writer for the subset of data NadeoImporter reads: meshes (vertices, polygons, normals, UV layers,
+# materials per polygon) and lights. Laid out like Blender's FBX exporter with its Trackmania settings (Y up, -Z
+# forward, no smoothing, no tangents), with mesh data read through foreach_get into NumPy arrays instead of per element.
+_FBX_VERSION = 7400
+_HEAD_MAGIC = b'Kaydara FBX Binary\x20\x20\x00\x1a\x00'
+# FBX SDK checks FileId against CreationTime, these are a known valid pair (also used by Blender's exporter)
+_FILE_ID = b'\x28\xb3\x2a\xeb\xb6\x24\xcc\xc2\xbf\xc8\xb0\x2a\xa9\x2b\xfc\xf1'
+_TIME_ID = '1970-01-01 10:00:00:000'
+_FOOT_ID = b'\xfa\xbc\xab\x09\xd0\xc8\xd4\x66\xb1\x76\xfb\x83\x1c\xf7\x26\x7e'
+_FOOT_MAGIC = b'\xf8\x5a\x8c\x6a\xde\xf5\xd9\x7e\xec\xe9\x0c\xe3\x75\x8f\x29\x0b'
+_NODE_HEADER = struct.Struct('<3IB')
+_SENTINEL = b'\x00' * 13
+# Arrays bigger than this are zlib compressed
+_ARRAY_COMPRESSION_THRESHOLD = 128
+_CREATOR = 'Trackmania Blender Toolbox FBX writer'
+
+# Blender (Z up, Y forward, meters) to FBX (Y up, -Z forward, centimeters)
+_GLOBAL_MATRIX = mathutils.Matrix.Scale(100, 4) @ mathutils.Matrix((
+    (1, 0, 0, 0),
+    (0, 0, 1, 0),
+    (0, -1, 0, 0),
+    (0, 0, 0, 1),
+))
+# Blender lights point along -Z, FBX ones along -Y
+_LIGHT_MATRIX = mathutils.Matrix.Rotation(math.pi / 2, 4, 'X')
+_LIGHT_TYPES = {'POINT': 0, 'SUN': 1, 'SPOT': 2, 'AREA': 3}
+_FIRST_UID = 1000
+
+
+# Marks int properties written as int64 (ids) instead of int32
+class _Int64(int):
+    pass
+
+def _compress_array(type_code, size, data):
+    data = zlib.compress(data, 1)
+    return type_code + struct.pack('<3I', size, 1, len(data)) + data
+
+# Big arrays are compressed by executor's threads (zlib releases the GIL), the returned future gives encoded bytes
+def _encode_array(type_code, array, executor):
+    data = array.tobytes()
+    if len(data) > _ARRAY_COMPRESSION_THRESHOLD:
+        return executor.submit(_compress_array, type_code, array.size, data)
+    return type_code + struct.pack('<3I', array.size, 0, len(data)) + data
+
+def _encode_property(value, executor):
+    if isinstance(value, np.ndarray):
+        if value.dtype == np.float64:
+            return _encode_array(b'd', value, executor)
+        if value.dtype == np.int32:
+            return _encode_array(b'i', value, executor)
+        raise TypeError('Unsupported FBX array type: {}'.format(value.dtype))
+    if isinstance(value, _Int64):
+        return b'L' + struct.pack('<q', value)
+    if isinstance(value, bool):
+        return b'C' + struct.pack('<?', value)
+    if isinstance(value, int):
+        return b'I' + struct.pack('<i', value)
+    if isinstance(value, float):
+        return b'D' + struct.pack('<d', value)
+    if isinstance(value, bytes):
+        return b'R' + struct.pack('<I', len(value)) + value
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+        return b'S' + struct.pack('<I', len(value)) + value
+    raise TypeError('Unsupported FBX property type: {}'.format(type(value)))
+
+def _name_class(name, class_name):
+    return name + '\x00\x01' + class_name
+
+class _Node:
+    def __init__(self, name, properties, executor):
+        self.name = name.encode()
+        self.properties = [_encode_property(property, executor) for property in properties]
+        self.children = []
+        self.executor = executor
+    
+    def add(self, name, *properties):
+        node = _Node(name, properties, self.executor)
+        self.children.append(node)
+        return node
+    
+    # Properties70 entry: name, type, label, flags, values
+    def add_property(self, name, type, label, flags, *values):
+        return self.add('P', name, type, label, flags, *values)
+    
+    # Like the FBX SDK, a nested list (or a node without properties which isn't last of its list) ends with a null node
+    def _has_sentinel(self, is_last):
+        return bool(self.children) or (not self.properties and not is_last)
+    
+    def write(self, chunks, offset, is_last):
+        self.properties = [property.result() if isinstance(property, concurrent.futures.Future) else property for property in self.properties]
+        properties_length = sum(len(property) for property in self.properties)
+        header_index = len(chunks)
+        chunks.append(None)
+        offset = offset + _NODE_HEADER.size + len(self.name) + properties_length
+        chunks.append(self.name)
+        chunks.extend(self.properties)
+        for child in self.children:
+            offset = child.write(chunks, offset, child is self.children[-1])
+        if self._has_sentinel(is_last):
+            chunks.append(_SENTINEL)
+            offset = offset + len(_SENTINEL)
+        chunks[header_index] = _NODE_HEADER.pack(offset, len(self.properties), properties_length, len(self.name))
+        return offset
+
+def _decompose(matrix):
+    location, rotation, scale = matrix.decompose()
+    rotation = [math.degrees(angle) for angle in rotation.to_euler('XYZ')]
+    return tuple(location), tuple(rotation), tuple(scale)
+
+def _get_array(collection, attribute, dtype, size=1):
+    array = np.empty(len(collection) * size, dtype=dtype)
+    collection.foreach_get(attribute, array)
+    return array
+
+# Recent Blender versions store mesh data as attributes, which are much faster to read than loops / polygons
+def _get_attribute_array(mesh, attribute_name, collection, attribute, dtype, size=1):
+    mesh_attribute = mesh.attributes.get(attribute_name)
+    if mesh_attribute is not None:
+        return _get_array(mesh_attribute.data, 'vector' if size > 1 else 'value', dtype, size)
+    return _get_array(collection, attribute, dtype, size)
+
+def _get_corner_normals(mesh):
+    if hasattr(mesh, 'corner_normals'):
+        return _get_array(mesh.corner_normals, 'vector', np.float32, 3)
+    # Before Blender 4.1, split normals had to be computed first
+    mesh.calc_normals_split()
+    return _get_array(mesh.loops, 'normal', np.float32, 3)
+
+def _get_uvs(uv_layer):
+    if hasattr(uv_layer, 'uv'):
+        return _get_array(uv_layer.uv, 'vector', np.float32, 2)
+    return _get_array(uv_layer.data, 'uv', np.float32, 2)
+
+# Unique (uv, vertex) pairs and the index of each loop's pair in them, so that UV islands are kept. UVs are compared
+# through their bits (packed in an int64): once loops are sorted by UV, (uv, vertex) keys are almost sorted, which the
+# stable sort (timsort) takes advantage of.
+def _get_unique_uvs(uvs, loop_vertices, vertex_count):
+    uvs = uvs.reshape(-1, 2)
+    # -0.0 and 0.0 must be the same UV
+    uvs[uvs == 0] = 0
+    uv_keys = uvs.view(np.int64).ravel()
+    order = np.argsort(uv_keys)
+    sorted_uv_keys = uv_keys[order]
+    uv_starts = np.empty(len(order), dtype=bool)
+    uv_starts[:1] = True
+    np.not_equal(sorted_uv_keys[1:], sorted_uv_keys[:-1], out=uv_starts[1:])
+    keys = (np.cumsum(uv_starts) - 1) * vertex_count + loop_vertices[order]
+    key_order = np.argsort(keys, kind='stable')
+    order = order[key_order]
+    keys = keys[key_order]
+    starts = np.empty(len(order), dtype=bool)
+    starts[:1] = True
+    np.not_equal(keys[1:], keys[:-1], out=starts[1:])
+    indices = np.empty(len(order), dtype=np.int32)
+    indices[order] = np.cumsum(starts) - 1
+    return uvs[order[starts]], indices
+
+# Builds the FBX document of one item's objects. Objects are written with their world transform, in the given order,
+# under the given names (so that objects don't need to be renamed to their Trackmania export names).
+class FbxDocument:
+    def __init__(self, executor, scene_name=''):
+        self.executor = executor
+        self.scene_name = scene_name
+        self.next_uid = _FIRST_UID
+        self.objects = _Node('Objects', (), executor)
+        self.connections = _Node('Connections', (), executor)
+        self.material_uids = {}
+        self.counts = {'Model': 0, 'Geometry': 0, 'Material': 0, 'NodeAttribute': 0}
+    
+    def _new_uid(self):
+        uid = _Int64(self.next_uid)
+        self.next_uid = self.next_uid + 1
+        return uid
+    
+    def _connect(self, source_uid, destination_uid):
+        self.connections.add('C', 'OO', _Int64(source_uid), _Int64(destination_uid))
+    
+    def _add_model(self, object, name, type, matrix):
+        uid = self._new_uid()
+        model = self.objects.add('Model', uid, _name_class(name, 'Model'), type)
+        model.add('Version', 232)
+        location, rotation, scale = _decompose(matrix)
+        properties = model.add('Properties70')
+        properties.add_property('Lcl Translation', 'Lcl Translation', '', 'A', *location)
+        properties.add_property('Lcl Rotation', 'Lcl Rotation', '', 'A', *rotation)
+        properties.add_property('Lcl Scaling', 'Lcl Scaling', '', 'A', *scale)
+        properties.add_property('DefaultAttributeIndex', 'int', 'Integer', '', 0)
+        properties.add_property('InheritType', 'enum', '', '', 1)
+        model.add('MultiLayer', 0)
+        model.add('MultiTake', 0)
+        model.add('Shading', True)
+        model.add('Culling', 'CullingOff')
+        self._connect(uid, 0)
+        self.counts['Model'] = self.counts['Model'] + 1
+        return uid
+    
+    def _get_material_uid(self, material):
+        if material.name not in self.material_uids:
+            uid = self._new_uid()
+            node = self.objects.add('Material', uid, _name_class(material.name, 'Material'), '')
+            node.add('Version', 102)
+            node.add('ShadingModel', 'Phong')
+            node.add('MultiLayer', 0)
+            properties = node.add('Properties70')
+            properties.add_property('DiffuseColor', 'Color', '', 'A', *[float(channel) for channel in material.diffuse_color[:3]])
+            self.material_uids[material.name] = uid
+            self.counts['Material'] = self.counts['Material'] + 1
+        return self.material_uids[material.name]
+    
+    # mesh is object's evaluated mesh (modifiers applied), in object space
+    def add_mesh(self, object, name, mesh):
+        model_uid = self._add_model(object, name, 'Mesh', _GLOBAL_MATRIX @ object.matrix_world)
+        geometry_uid = self._new_uid()
+        geometry = self.objects.add('Geometry', geometry_uid, _name_class(object.data.name, 'Geometry'), 'Mesh')
+        geometry.add('Properties70')
+        geometry.add('GeometryVersion', 124)
+        self._connect(geometry_uid, model_uid)
+        self.counts['Geometry'] = self.counts['Geometry'] + 1
+        
+        # Vertices and polygons (last vertex of each polygon is stored as -index - 1)
+        vertices = _get_attribute_array(mesh, 'position', mesh.vertices, 'co', np.float32, 3)
+        loop_vertices = _get_attribute_array(mesh, '.corner_vert', mesh.loops, 'vertex_index', np.int32)
+        loop_starts = _get_array(mesh.polygons, 'loop_start', np.int32)
+        polygon_vertices = loop_vertices.copy()
+        if len(loop_starts):
+            polygon_vertices[loop_starts[1:] - 1] ^= -1
+            polygon_vertices[-1] ^= -1
+        geometry.add('Vertices', vertices.astype(np.float64))
+        geometry.add('PolygonVertexIndex', polygon_vertices)
+        
+        # Edges, as the first loop using each of them
+        loop_edges = _get_attribute_array(mesh, '.corner_edge', mesh.loops, 'edge_index', np.int32)
+        _, first_loops = np.unique(loop_edges, return_index=True)
+        geometry.add('Edges', np.sort(first_loops).astype(np.int32))
+        
+        # Normals, per polygon vertex (not deduplicated, like Blender's exporter before 4.2)
+        layer_normal = geometry.add('LayerElementNormal', 0)
+        layer_normal.add('Version', 101)
+        layer_normal.add('Name', '')
+        layer_normal.add('MappingInformationType', 'ByPolygonVertex')
+        layer_normal.add('ReferenceInformationType', 'Direct')
+        layer_normal.add('Normals', _get_corner_normals(mesh).astype(np.float64))
+        
+        # UV layers
+        uv_layer_names = []
+        for uv_index, uv_layer in enumerate(mesh.uv_layers):
+            uvs, uv_indices = _get_unique_uvs(_get_uvs(uv_layer), loop_vertices, len(vertices) // 3)
+            layer_uv = geometry.add('LayerElementUV', uv_index)
+            layer_uv.add('Version', 101)
+            layer_uv.add('Name', uv_layer.name)
+            layer_uv.add('MappingInformationType', 'ByPolygonVertex')
+            layer_uv.add('ReferenceInformationType', 'IndexToDirect')
+            layer_uv.add('UV', uvs.astype(np.float64).ravel())
+            layer_uv.add('UVIndex', uv_indices)
+            uv_layer_names.append(uv_layer.name)
+        
+        # Materials, indexed in the order they are connected to the model. Empty or out of range slots use the first
+        # material, like Blender's exporter.
+        slot_materials = [material_slot.material for material_slot in object.material_slots]
+        materials = []
+        for material in slot_materials:
+            if material is not None and material not in materials:
+                materials.append(material)
+        if materials:
+            slot_indices = np.array([materials.index(material) if material is not None else 0 for material in slot_materials], dtype=np.int32)
+            layer_material = geometry.add('LayerElementMaterial', 0)
+            layer_material.add('Version', 101)
+            layer_material.add('Name', '')
+            polygon_materials = _get_attribute_array(mesh, 'material_index', mesh.polygons, 'material_index', np.int32)
+            if len(materials) > 1:
+                polygon_materials[(polygon_materials < 0) | (polygon_materials >= len(slot_indices))] = 0
+                layer_material.add('MappingInformationType', 'ByPolygon')
+                layer_material.add('ReferenceInformationType', 'IndexToDirect')
+                layer_material.add('Materials', slot_indices[polygon_materials])
+            else:
+                layer_material.add('MappingInformationType', 'AllSame')
+                layer_material.add('ReferenceInformationType', 'IndexToDirect')
+                layer_material.add('Materials', np.zeros(1, dtype=np.int32))
+            for material in materials:
+                self._connect(self._get_material_uid(material), model_uid)
+        
+        # Layers, first one has normals, first UV layer and materials, following ones the other UV layers
+        layer = geometry.add('Layer', 0)
+        layer.add('Version', 100)
+        layer_types = ['LayerElementNormal'] + (['LayerElementUV'] if uv_layer_names else []) + (['LayerElementMaterial'] if materials else [])
+        for layer_type in layer_types:
+            layer_element = layer.add('LayerElement')
+            layer_element.add('Type', layer_type)
+            layer_element.add('TypedIndex', 0)
+        for uv_index in range(1, len(uv_layer_names)):
+            layer = geometry.add('Layer', uv_index)
+            layer.add('Version', 100)
+            layer_element = layer.add('LayerElement')
+            layer_element.add('Type', 'LayerElementUV')
+            layer_element.add('TypedIndex', uv_index)
+    
+    def add_light(self, object, name):
+        light = object.data
+        model_uid = self._add_model(object, name, 'Light', _GLOBAL_MATRIX @ object.matrix_world @ _LIGHT_MATRIX)
+        attribute_uid = self._new_uid()
+        attribute = self.objects.add('NodeAttribute', attribute_uid, _name_class(light.name, 'NodeAttribute'), 'Light')
+        attribute.add('GeometryVersion', 124)
+        properties = attribute.add('Properties70')
+        properties.add_property('LightType', 'enum', '', '', _LIGHT_TYPES.get(light.type, 0))
+        properties.add_property('CastLight', 'bool', '', '', 1)
+        properties.add_property('Color', 'Color', '', 'A', *[float(channel) for channel in light.color])
+        properties.add_property('Intensity', 'Number', '', 'A', light.energy * 100.0 * pow(2.0, getattr(light, 'exposure', 0.0)))
+        properties.add_property('DecayType', 'enum', '', '', 2)
+        properties.add_property('DecayStart', 'double', 'Number', '', 2500.0)
+        properties.add_property('CastShadows', 'bool', '', '', int(light.use_shadow))
+        if light.type == 'SPOT':
+            properties.add_property('OuterAngle', 'double', 'Number', '', math.degrees(light.spot_size))
+            properties.add_property('InnerAngle', 'double', 'Number', '', math.degrees(light.spot_size * (1.0 - light.spot_blend)))
+        self._connect(attribute_uid, model_uid)
+        self.counts['NodeAttribute'] = self.counts['NodeAttribute'] + 1
+    
+    def _get_root_nodes(self):
+        header = _Node('FBXHeaderExtension', (), self.executor)
+        header.add('FBXHeaderVersion', 1003)
+        header.add('FBXVersion', _FBX_VERSION)
+        header.add('EncryptionType', 0)
+        # Fixed time stamp, so that unchanged items give identical files
+        time_stamp = header.add('CreationTimeStamp')
+        for name, value in [('Version', 1000), ('Year', 1970), ('Month', 1), ('Day', 1), ('Hour', 10), ('Minute', 0), ('Second', 0), ('Millisecond', 0)]:
+            time_stamp.add(name, value)
+        header.add('Creator', _CREATOR)
+        scene_info = header.add('SceneInfo', _name_class('GlobalInfo', 'SceneInfo'), 'UserData')
+        scene_info.add('Type', 'UserData')
+        scene_info.add('Version', 100)
+        meta_data = scene_info.add('MetaData')
+        meta_data.add('Version', 100)
+        for name in ['Title', 'Subject', 'Author', 'Keywords', 'Revision', 'Comment']:
+            meta_data.add(name, '')
+        
+        global_settings = _Node('GlobalSettings', (), self.executor)
+        global_settings.add('Version', 1000)
+        properties = global_settings.add('Properties70')
+        for name, value in [('UpAxis', 1), ('UpAxisSign', 1), ('FrontAxis', 2), ('FrontAxisSign', 1), ('CoordAxis', 0), ('CoordAxisSign', 1), ('OriginalUpAxis', -1), ('OriginalUpAxisSign', 1)]:
+            properties.add_property(name, 'int', 'Integer', '', value)
+        properties.add_property('UnitScaleFactor', 'double', 'Number', '', 1.0)
+        properties.add_property('OriginalUnitScaleFactor', 'double', 'Number', '', 1.0)
+        
+        documents = _Node('Documents', (), self.executor)
+        documents.add('Count', 1)
+        document = documents.add('Document', _Int64(self._new_uid()), self.scene_name, self.scene_name)
+        properties = document.add('Properties70')
+        properties.add_property('SourceObject', 'object', '', '')
+        properties.add_property('ActiveAnimStackName', 'KString', '', '', '')
+        document.add('RootNode', _Int64(0))
+        
+        definitions = _Node('Definitions', (), self.executor)
+        definitions.add('Version', 100)
+        counts = [('GlobalSettings', 1)] + [(name, count) for name, count in self.counts.items() if count]
+        definitions.add('Count', sum(count for _, count in counts))
+        for name, count in counts:
+            object_type = definitions.add('ObjectType', name)
+            object_type.add('Count', count)
+        
+        takes = _Node('Takes', (), self.executor)
+        takes.add('Current', '')
+        
+        return [
+            header,
+            _Node('FileId', (_FILE_ID,), self.executor),
+            _Node('CreationTime', (_TIME_ID,), self.executor),
+            _Node('Creator', (_CREATOR,), self.executor),
+            global_settings,
+            documents,
+            _Node('References', (), self.executor),
+            definitions,
+            self.objects,
+            self.connections,
+            takes,
+        ]
+    
+    def to_bytes(self):
+        chunks = [_HEAD_MAGIC, struct.pack('<I', _FBX_VERSION)]
+        offset = len(_HEAD_MAGIC) + 4
+        nodes = self._get_root_nodes()
+        for node in nodes:
+            offset = node.write(chunks, offset, node is nodes[-1])
+        chunks.append(_SENTINEL)
+        offset = offset + len(_SENTINEL)
+        
+        # Footer, padded to 16 bytes (a full 16 bytes when already aligned)
+        chunks.append(_FOOT_ID + b'\x00' * 4)
+        offset = offset + len(_FOOT_ID) + 4
+        padding = ((offset + 15) & ~15) - offset
+        chunks.append(b'\x00' * (padding or 16))
+        chunks.append(struct.pack('<I', _FBX_VERSION) + b'\x00' * 120 + _FOOT_MAGIC)
+        return b''.join(chunks)
+
+# Returns the FBX file content of objects (meshes and lights, others are ignored). names maps objects to the name they
+# are exported with.
+def get_fbx_bytes(objects, names, depsgraph, scene_name=''):
+    with concurrent.futures.ThreadPoolExecutor(thread_name_prefix='FbxWriter') as executor:
+        document = FbxDocument(executor, scene_name)
+        for object in objects:
+            if object.type == 'MESH':
+                evaluated_object = object.evaluated_get(depsgraph)
+                # Evaluated meshes are read in place, only Blender before 4.1 needs a copy to compute split normals in
+                if hasattr(evaluated_object.data, 'corner_normals'):
+                    document.add_mesh(object, names.get(object, object.name), evaluated_object.data)
+                    continue
+                mesh = evaluated_object.to_mesh()
+                try:
+                    document.add_mesh(object, names.get(object, object.name), mesh)
+                finally:
+                    evaluated_object.to_mesh_clear()
+            elif object.type == 'LIGHT':
+                document.add_light(object, names.get(object, object.name))
+        return document.to_bytes()
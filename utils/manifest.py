@@ -0,0 +1,342 @@
+import bpy
+import hashlib
+import json
+import numpy as np
+import os
+import pathlib
+import time
+from ..utils import output
+from ..utils import preferences
+
+_MANIFEST_VERSION = 1
+_MANIFEST_FILENAME = '.trackmania_manifest.json'
+# Seconds save() waits for another export to release the manifest, and after which a lock is considered left over by a
+# crashed export
+_LOCK_TIMEOUT = 30
+_LOCK_STALE_AGE = 120
+
+# Inputs each export stage depends on, stages not listed here are never skipped
+_STAGE_INPUTS = {
+    'export_mesh': ('meshes', 'materials', 'lights', 'fbx_writer'),
+    'export_mesh_params': ('paths', 'settings', 'materials', 'lights'),
+    'export_icon': ('meshes', 'materials', 'material_nodes', 'lights', 'icon_settings', 'icon_scene', 'camera'),
+    'export_item': ('paths', 'settings', 'pivots', 'socket', 'author'),
+    # Files written by the previous stages rather than their inputs, so that anything changing them (e.g. icon settings,
+    # FBX writer) makes the item be imported again
+    'nadeo_import': ('paths', 'import_files'),
+}
+
+# Files a stage writes, it isn't skipped when they are missing
+_STAGE_OUTPUTS = {
+    'export_mesh': lambda item: item.mesh_path,
+    'export_mesh_params': lambda item: item.mesh_params_path,
+    'export_icon': lambda item: item.icon_path.with_name(item.icon_path.name + '.tga'),
+    'export_item': lambda item: item.item_xml_path,
+}
+
+# UI only properties that don't change what is exported
+_IGNORED_PROPERTIES = {'rna_type', 'identifier_search'}
+
+# Scene settings the icon renderer copies to its scratch scene (see operators.icon), down to nested settings of this
+# depth, and those it then overrides (icons are always 64x64 transparent TGAs)
+ICON_SCENE_SETTINGS = ['render', 'eevee', 'cycles', 'view_settings', 'display_settings']
+ICON_SCENE_SETTINGS_MAX_DEPTH = 2
+_ICON_SCENE_OVERRIDDEN_PROPERTIES = {'filepath', 'resolution_x', 'resolution_y', 'resolution_percentage', 'film_transparent', 'file_format'}
+
+# Camera settings changing what a user camera renders (runtime ID properties such as session_uid change every session)
+_CAMERA_FIELDS = ('type', 'lens', 'lens_unit', 'ortho_scale', 'sensor_width', 'sensor_height', 'sensor_fit', 'shift_x', 'shift_y', 'clip_start', 'clip_end')
+
+
+def _get_property_values(property_group):
+    values = []
+    for property in property_group.bl_rna.properties:
+        if property.identifier in _IGNORED_PROPERTIES or property.type in ['POINTER', 'COLLECTION']:
+            continue
+        value = getattr(property_group, property.identifier)
+        if getattr(property, 'is_array', False):
+            value = tuple(value)
+        values.append((property.identifier, value))
+    return values
+
+def _update_array(hasher, collection, attribute, dtype, size=1):
+    array = np.empty(len(collection) * size, dtype=dtype)
+    collection.foreach_get(attribute, array)
+    hasher.update(array.tobytes())
+
+def _update_mesh(hasher, mesh):
+    _update_array(hasher, mesh.vertices, 'co', np.float32, 3)
+    _update_array(hasher, mesh.loops, 'vertex_index', np.int32)
+    _update_array(hasher, mesh.polygons, 'loop_total', np.int32)
+    _update_array(hasher, mesh.polygons, 'material_index', np.int32)
+    _update_array(hasher, mesh.polygons, 'use_smooth', np.bool_)
+    for uv_layer in mesh.uv_layers:
+        hasher.update(uv_layer.name.encode())
+        _update_array(hasher, uv_layer.data, 'uv', np.float32, 2)
+
+def _update_values(hasher, values):
+    hasher.update(repr(values).encode())
+
+def _hash_meshes(context, item):
+    hasher = hashlib.sha1()
+    depsgraph = context.evaluated_depsgraph_get()
+    for object in item.objects:
+        if object.type != 'MESH':
+            continue
+        _update_values(hasher, (
+            object.name,
+            object.hide_render,
+            [tuple(row) for row in object.matrix_world],
+            _get_property_values(object.data.trackmania_mesh),
+            [slot.material.name if slot.material else None for slot in object.material_slots],
+        ))
+        # Evaluated mesh so that modifiers are taken into account
+        _update_mesh(hasher, object.evaluated_get(depsgraph).data)
+    return hasher.hexdigest()
+
+def _hash_materials(context, item):
+    materials = {}
+    for object in item.objects:
+        for material_slot in object.material_slots:
+            material = material_slot.material
+            if material is not None:
+                materials[material.name] = _get_property_values(material.trackmania_material)
+    return sorted(materials.items())
+
+def _hash_lights(context, item):
+    lights = []
+    for object in item.objects:
+        if object.type != 'LIGHT':
+            continue
+        light = object.data
+        lights.append((
+            object.name,
+            [tuple(row) for row in object.matrix_world],
+            light.type,
+            tuple(light.color),
+            light.energy,
+            getattr(light, 'distance', None),
+            getattr(light, 'spot_size', None),
+            getattr(light, 'spot_blend', None),
+        ))
+    return lights
+
+def _hash_pivots(context, item):
+    return [(object.name, tuple(object.location)) for object in item.objects if object.type == 'EMPTY']
+
+# Spawn meshes are exported as _socket_start, where the item is placed from
+def _hash_socket(context, item):
+    return [(object.name, [tuple(row) for row in object.matrix_world]) for object in item.objects if object.type == 'MESH' and object.data.trackmania_mesh.mesh_type == 'SPAWN']
+
+# Files NadeoImporter reads, hashed when it is about to run (previous stages of the item already wrote them)
+def _hash_import_files(context, item):
+    icon_tga_path = item.icon_path.with_name(item.icon_path.name + '.tga')
+    return [output.get_file_hash(path) for path in [item.item_xml_path, item.mesh_params_path, item.mesh_path, icon_tga_path]]
+
+def _hash_camera(context, item):
+    camera = context.scene.camera
+    if item.settings.icon_generate_camera or camera is None:
+        return None
+    return (camera.name, [tuple(row) for row in camera.matrix_world], [getattr(camera.data, field) for field in _CAMERA_FIELDS])
+
+def _get_node_tree_values(node_tree):
+    nodes = []
+    for node in node_tree.nodes:
+        inputs = []
+        for input in node.inputs:
+            value = getattr(input, 'default_value', None)
+            if value is not None and not isinstance(value, (bool, int, float, str)):
+                value = tuple(value)
+            inputs.append((input.identifier, value))
+        image = getattr(node, 'image', None)
+        nodes.append((node.name, node.bl_idname, inputs, image.filepath if image is not None else None))
+    links = [(link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier) for link in node_tree.links]
+    return sorted(nodes), sorted(links)
+
+# Look of materials, only matters for icons
+def _hash_material_nodes(context, item):
+    materials = {}
+    for object in item.objects:
+        for material_slot in object.material_slots:
+            material = material_slot.material
+            if material is not None and material.name not in materials:
+                node_values = _get_node_tree_values(material.node_tree) if material.use_nodes and material.node_tree else None
+                materials[material.name] = (tuple(material.diffuse_color), node_values)
+    return sorted(materials.items())
+
+def _hash_icon_settings(context, item):
+    return [(identifier, value) for identifier, value in _get_property_values(item.settings) if identifier.startswith('icon_')]
+
+# Values of the settings the icon renderer copies, walked like it copies them
+def _get_settings_values(settings, depth=0):
+    values = []
+    for property in settings.bl_rna.properties:
+        identifier = property.identifier
+        if identifier == 'rna_type' or identifier in _ICON_SCENE_OVERRIDDEN_PROPERTIES:
+            continue
+        if property.type == 'POINTER':
+            value = getattr(settings, identifier, None)
+            if depth < ICON_SCENE_SETTINGS_MAX_DEPTH and value is not None and not isinstance(value, bpy.types.ID):
+                values.append((identifier, _get_settings_values(value, depth + 1)))
+            continue
+        if property.type == 'COLLECTION' or property.is_readonly:
+            continue
+        value = getattr(settings, identifier, None)
+        if isinstance(value, set):
+            value = tuple(sorted(value))
+        elif getattr(property, 'is_array', False):
+            value = tuple(value)
+        values.append((identifier, value))
+    return values
+
+def _hash_icon_scene(context, item):
+    scene = context.scene
+    settings = [(name, _get_settings_values(getattr(scene, name))) for name in ICON_SCENE_SETTINGS if hasattr(scene, name)]
+    # The world is shared with the scratch scene rather than copied
+    world = scene.world
+    world_values = None
+    if world is not None:
+        node_values = _get_node_tree_values(world.node_tree) if world.use_nodes and world.node_tree else None
+        world_values = (world.name, tuple(world.color), node_values)
+    return settings, world_values
+
+_INPUT_HASHERS = {
+    'paths': lambda context, item: [str(item.path), str(item.mesh_path), str(item.mesh_params_path)],
+    'settings': lambda context, item: _get_property_values(item.settings),
+    'author': lambda context, item: preferences.get(context).author_name,
+    'fbx_writer': lambda context, item: preferences.get(context).fbx_writer,
+    'meshes': _hash_meshes,
+    'materials': _hash_materials,
+    'lights': _hash_lights,
+    'pivots': _hash_pivots,
+    'socket': _hash_socket,
+    'import_files': _hash_import_files,
+    'camera': _hash_camera,
+    'material_nodes': _hash_material_nodes,
+    'icon_settings': _hash_icon_settings,
+    'icon_scene': _hash_icon_scene,
+}
+
+# Hashes are computed once per item and input, then shared by the manifest and stage caches (e.g. icons)
+def get_input_hash(context, item, input):
+    if input not in item.input_hashes:
+        value = _INPUT_HASHERS[input](context, item)
+        if not isinstance(value, str):
+            value = hashlib.sha1(repr(value).encode()).hexdigest()
+        item.input_hashes[input] = value
+    return item.input_hashes[input]
+
+def get_inputs_hash(context, item, inputs, salt):
+    hasher = hashlib.sha1(salt.encode())
+    for input in inputs:
+        hasher.update(get_input_hash(context, item, input).encode())
+    return hasher.hexdigest()
+
+# Lock file next to the manifest, held while it is read, merged and written so that concurrent exports (e.g. CLI
+# workers) don't overwrite each other's entries
+class _ManifestLock:
+    def __init__(self, filepath):
+        self.filepath = filepath.with_name(filepath.name + '.lock')
+        self.acquired = False
+    
+    def _remove_if_stale(self):
+        try:
+            if time.time() - self.filepath.stat().st_mtime > _LOCK_STALE_AGE:
+                print('WARNING: removing stale manifest lock {}'.format(self.filepath))
+                self.filepath.unlink()
+        except FileNotFoundError:
+            pass
+    
+    def __enter__(self):
+        deadline = time.perf_counter() + _LOCK_TIMEOUT
+        while True:
+            try:
+                os.close(os.open(self.filepath, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                self.acquired = True
+                return self
+            except FileExistsError:
+                self._remove_if_stale()
+            if time.perf_counter() > deadline:
+                return self
+            time.sleep(0.05)
+    
+    def __exit__(self, *args):
+        if self.acquired:
+            try:
+                self.filepath.unlink()
+            except OSError:
+                pass
+            self.acquired = False
+
+# Records a content hash of the inputs of every stage of every exported item, so that stages whose inputs didn't
+# change since their last successful run can be skipped.
+class Manifest:
+    def __init__(self, filepath):
+        self.filepath = pathlib.Path(filepath)
+        self.items = self._load()
+        self.changed_items = set()
+        self.skipped = 0
+    
+    def _load(self):
+        try:
+            with open(self.filepath) as file:
+                data = json.load(file)
+            if data.get('version') == _MANIFEST_VERSION:
+                return data.get('items', {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print('WARNING: ignoring unreadable manifest {}: {}'.format(self.filepath, e))
+        return {}
+    
+    @staticmethod
+    def get_filepath(items_dir):
+        return pathlib.Path(items_dir) / _MANIFEST_FILENAME
+    
+    def get_stage_hash(self, context, item, stage_name):
+        inputs = _STAGE_INPUTS.get(stage_name)
+        if inputs is None:
+            return None
+        return get_inputs_hash(context, item, inputs, stage_name)
+    
+    def is_up_to_date(self, context, item, stage_name):
+        stage_hash = self.get_stage_hash(context, item, stage_name)
+        if stage_hash is None or self.items.get(str(item.path), {}).get(stage_name) != stage_hash:
+            return False
+        get_output = _STAGE_OUTPUTS.get(stage_name)
+        return get_output is None or get_output(item).exists()
+    
+    def update(self, context, item, stage_name):
+        stage_hash = self.get_stage_hash(context, item, stage_name)
+        if stage_hash is not None:
+            self.items.setdefault(str(item.path), {})[stage_name] = stage_hash
+            self.changed_items.add(str(item.path))
+    
+    def invalidate(self, item, stage_name):
+        self.items.get(str(item.path), {}).pop(stage_name, None)
+        self.changed_items.add(str(item.path))
+    
+    # Only items changed by this export are written over the current file content, under a lock so that several
+    # exports (e.g. CLI workers) sharing the manifest don't drop each other's entries. When the lock can't be acquired
+    # the manifest isn't written, stages of changed items then run again on the next export.
+    def save(self):
+        try:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            print('WARNING: failed to write manifest {}: {}'.format(self.filepath, e))
+            return
+        with _ManifestLock(self.filepath) as lock:
+            if not lock.acquired:
+                print('WARNING: manifest {} is locked by another export, not written'.format(self.filepath))
+                return
+            items = self._load()
+            for item_path in self.changed_items:
+                items[item_path] = self.items.get(item_path, {})
+            self.items = items
+            self.changed_items = set()
+            tmp_filepath = self.filepath.with_name('{}.{}.tmp'.format(self.filepath.name, os.getpid()))
+            try:
+                with open(tmp_filepath, 'w') as file:
+                    json.dump({'version': _MANIFEST_VERSION, 'items': items}, file, indent=1, sort_keys=True)
+                os.replace(tmp_filepath, self.filepath)
+            except OSError as e:
+                print('WARNING: failed to write manifest {}: {}'.format(self.filepath, e))
@@ -1,22 +1,55 @@
+import bisect
+import collections
 import functools
+import os
 import pathlib
 import re
+from ..utils import cache as cache_utils
+from ..utils import registry
 
+_SNAPSHOT_VERSION = 1
+_SNAPSHOT_FILENAME = 'material_library.cache'
+_TOKEN_SEPARATORS = re.compile(r'\(|\)|,')
+_UV_BASE_MATERIAL = 1
+_UV_LIGHTMAP = 2
+_GAMEPLAY_COMPATIBLE_MATERIALS_FILEPATH = pathlib.Path(__file__).parent / 'gameplay_compatible_materials.txt'
 
-@functools.lru_cache(maxsize=1)
-def _get_gameplay_compatible_materials():
-    path = pathlib.Path(__file__).parent / 'gameplay_compatible_materials.txt'
-    file = open(path)
+
+def _load_gameplay_compatible_materials():
+    file = open(_GAMEPLAY_COMPATIBLE_MATERIALS_FILEPATH)
     lines = file.readlines()
-    return [line.split('\n')[0] for line in lines]
+    return frozenset(line.split('\n')[0] for line in lines)
+
+_gameplay_compatible_materials_registry = registry.FileRegistry(
+    'gameplay_compatible_materials',
+    _load_gameplay_compatible_materials,
+    lambda: [_GAMEPLAY_COMPATIBLE_MATERIALS_FILEPATH]
+)
+
+def _get_gameplay_compatible_materials():
+    return _gameplay_compatible_materials_registry.get()
 
-class TrackmaniaMaterial():
-    def __init__(self, identifier):
-        self.identifier = identifier
-        self.can_customize_color = 'Custom' in identifier
-        self.can_customize_gameplay = identifier in _get_gameplay_compatible_materials()
-        self.needs_base_material_uv = False
-        self.needs_lightmap_uv = False
+# Immutable record so that lookups can be shared and precomputed once per library load
+class TrackmaniaMaterial(collections.namedtuple('TrackmaniaMaterial', [
+    'identifier',
+    'can_customize_color',
+    'can_customize_gameplay',
+    'needs_base_material_uv',
+    'needs_lightmap_uv',
+])):
+    __slots__ = ()
+    
+    @classmethod
+    def from_flags(cls, identifier, uv_flags=0, gameplay_compatible_materials=None):
+        if gameplay_compatible_materials is None:
+            gameplay_compatible_materials = _get_gameplay_compatible_materials()
+        return cls(
+            identifier,
+            'Custom' in identifier,
+            identifier in gameplay_compatible_materials,
+            bool(uv_flags & _UV_BASE_MATERIAL),
+            bool(uv_flags & _UV_LIGHTMAP)
+        )
     
     def __repr__(self):
         options = []
@@ -32,27 +65,87 @@ class TrackmaniaMaterial():
             return '(' + self.identifier + ')'
         return '(' + self.identifier + ': ' + ' | '.join(options) + ')'
 
-@functools.lru_cache(maxsize=1)
-def get_trackmania_materials(filepath):
+# Compact table of the library: material identifiers (in file order) and their UV layer flags
+def _parse_material_library(filepath):
     file = open(filepath)
-
-    materials = {}
-    material = None
+    
+    identifiers = []
+    uv_flags = bytearray()
     lines = file.readlines()
     for line in lines:
-        tokens = [token.strip() for token in re.split('\(|\)|,', line)]
+        tokens = [token.strip() for token in _TOKEN_SEPARATORS.split(line)]
         if len(tokens) < 2:
             continue
         if tokens[0] == 'DMaterial':
-            materials[tokens[1]] = TrackmaniaMaterial(tokens[1])
-            material = materials[tokens[1]]
+            identifiers.append(tokens[1])
+            uv_flags.append(0)
         elif tokens[0] == 'DUvLayer':
             if tokens[1] == 'BaseMaterial':
-                material.needs_base_material_uv = True
+                uv_flags[-1] |= _UV_BASE_MATERIAL
             elif tokens[1] == 'Lightmap':
-                material.needs_lightmap_uv = True
+                uv_flags[-1] |= _UV_LIGHTMAP
+    return identifiers, bytes(uv_flags)
+
+def _load_material_library(filepath, snapshot_filepath):
+    # Snapshot is only valid for the exact library file it was compiled from
+    stat = os.stat(filepath)
+    key = (str(filepath), stat.st_mtime_ns, stat.st_size)
+    table = cache_utils.load(snapshot_filepath, _SNAPSHOT_VERSION, key)
+    if table is None:
+        table = _parse_material_library(filepath)
+        cache_utils.save(snapshot_filepath, _SNAPSHOT_VERSION, key, table)
+    return table
+
+def _load_trackmania_materials(filepath):
+    identifiers, uv_flags = _load_material_library(filepath, cache_utils.get_filepath(_SNAPSHOT_FILENAME))
+    gameplay_compatible_materials = _get_gameplay_compatible_materials()
+    
+    materials = {}
+    for identifier, flags in zip(identifiers, uv_flags):
+        materials[identifier] = TrackmaniaMaterial.from_flags(identifier, flags, gameplay_compatible_materials)
     return materials
 
+_trackmania_materials_registry = registry.FileRegistry(
+    'trackmania_materials',
+    _load_trackmania_materials,
+    lambda filepath: [filepath, _GAMEPLAY_COMPATIBLE_MATERIALS_FILEPATH]
+)
+
+def get_trackmania_materials(filepath):
+    return _trackmania_materials_registry.get(filepath)
+
+# Case insensitive search over material identifiers: prefix matches (bisect on sorted names) come first, then
+# other substring matches (candidates narrowed down with a trigram index)
+class MaterialSearchIndex:
+    def __init__(self, identifiers):
+        self.identifiers = sorted(identifiers, key=str.lower)
+        self.lowered = [identifier.lower() for identifier in self.identifiers]
+        self.trigrams = {}
+        for index, lowered in enumerate(self.lowered):
+            for i in range(len(lowered) - 2):
+                self.trigrams.setdefault(lowered[i:i + 3], set()).add(index)
+    
+    def _get_prefix_indices(self, text):
+        start = bisect.bisect_left(self.lowered, text)
+        end = bisect.bisect_left(self.lowered, text + '\U0010ffff', start)
+        return range(start, end)
+    
+    def _get_substring_indices(self, text):
+        if len(text) < 3:
+            return [index for index, lowered in enumerate(self.lowered) if text in lowered]
+        trigram_indices = sorted((self.trigrams.get(text[i:i + 3], set()) for i in range(len(text) - 2)), key=len)
+        candidates = set.intersection(*trigram_indices) if trigram_indices[0] else set()
+        return sorted(index for index in candidates if text in self.lowered[index])
+    
+    def search(self, text):
+        text = text.lower()
+        if not text:
+            return list(self.identifiers)
+        prefix_indices = self._get_prefix_indices(text)
+        results = [self.identifiers[index] for index in prefix_indices]
+        results.extend(self.identifiers[index] for index in self._get_substring_indices(text) if index not in prefix_indices)
+        return results
+
 def _get_values(filename):
     path = pathlib.Path(__file__).parent / filename
     file = open(path)
@@ -0,0 +1,89 @@
+import collections
+import concurrent.futures
+import os
+import pathlib
+import shlex
+import subprocess
+import time
+
+# Overrides NadeoImporter.exe, e.g. with a stand-in script when NadeoImporter is not available. Either the path of an
+# executable (spaces allowed) or a command line, quoted like a POSIX shell would (e.g. "python3 '/path with spaces/importer.py'")
+_IMPORTER_ENVIRONMENT_VARIABLE = 'TRACKMANIA_NADEO_IMPORTER'
+
+_pool = None
+_pool_workers = None
+
+
+def _get_message(output):
+    # First line is NadeoImporter's banner, the rest describes what happened
+    lines = output.decode('utf-8', errors='replace').replace('\r', '').split('\n', 1)
+    return (lines[1] if len(lines) > 1 else lines[0]).rstrip('\n')
+
+class ImportResult(collections.namedtuple('ImportResult', [
+    'path',
+    'returncode',
+    'stdout',
+    'stderr',
+    'timed_out',
+    'duration',
+])):
+    __slots__ = ()
+    
+    @property
+    def success(self):
+        return not self.timed_out and self.returncode == 0
+    
+    @property
+    def message(self):
+        message = _get_message(self.stdout)
+        if not message and self.stderr:
+            message = _get_message(self.stderr)
+        return message
+    
+    def get_report(self):
+        if self.timed_out:
+            return {'ERROR'}, 'NadeoImporter timed out after {:.1f}s on {}.'.format(self.duration, self.path.name)
+        if not self.success:
+            return {'ERROR'}, 'Error occured while importing item: ' + self.message
+        return {'INFO'}, 'Item imported successfully: ' + self.message
+
+def get_importer_command(install_dir):
+    importer = os.environ.get(_IMPORTER_ENVIRONMENT_VARIABLE)
+    if importer:
+        if os.path.isfile(importer):
+            return [importer]
+        return shlex.split(importer)
+    return [str(pathlib.Path(install_dir, 'NadeoImporter.exe'))]
+
+def run(importer_command, item_path, work_dir_path, timeout=None):
+    command = importer_command + ['Item', os.path.relpath(str(item_path), work_dir_path)]
+    start = time.perf_counter()
+    try:
+        process = subprocess.run(command, capture_output=True, timeout=timeout or None)
+    except subprocess.TimeoutExpired as e:
+        return ImportResult(item_path, None, e.stdout or b'', e.stderr or b'', True, time.perf_counter() - start)
+    except OSError as e:
+        return ImportResult(item_path, None, b'', str(e).encode(), False, time.perf_counter() - start)
+    return ImportResult(item_path, process.returncode, process.stdout, process.stderr, False, time.perf_counter() - start)
+
+# Importer processes run on a bounded pool of threads (each one waiting on its own process), the pool is kept alive
+# between exports and recreated only when the worker count changes.
+def get_pool(workers):
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='NadeoImporter')
+        _pool_workers = workers
+    return _pool
+
+def submit(workers, importer_command, item_path, work_dir_path, timeout=None):
+    return get_pool(workers).submit(run, importer_command, item_path, work_dir_path, timeout)
+
+# Queued imports are cancelled, running ones finish in the background without being waited for
+def shutdown():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+    _pool_workers = None
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import pathlib
+
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+# Bytes / files written and skipped (because unchanged) by one export
+class OutputStats:
+    def __init__(self):
+        self.written_files = 0
+        self.written_bytes = 0
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+    
+    def add(self, size, written):
+        if written:
+            self.written_files = self.written_files + 1
+            self.written_bytes = self.written_bytes + size
+        else:
+            self.skipped_files = self.skipped_files + 1
+            self.skipped_bytes = self.skipped_bytes + size
+    
+    def get_summary(self):
+        return 'Wrote {} file(s) ({:.1f} KB), skipped {} unchanged file(s) ({:.1f} KB).'.format(
+            self.written_files, self.written_bytes / 1024, self.skipped_files, self.skipped_bytes / 1024)
+    
+    def to_dict(self):
+        return {
+            'written_files': self.written_files,
+            'written_bytes': self.written_bytes,
+            'skipped_files': self.skipped_files,
+            'skipped_bytes': self.skipped_bytes,
+        }
+
+def _hash_file(path):
+    hasher = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(_HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.digest()
+
+# Content hash (hex) of the file at path, None when it doesn't exist
+def get_file_hash(path):
+    try:
+        return _hash_file(path).hex()
+    except FileNotFoundError:
+        return None
+
+def _is_same_file_content(path, other_path):
+    try:
+        if os.path.getsize(path) != os.path.getsize(other_path):
+            return False
+        return _hash_file(path) == _hash_file(other_path)
+    except OSError:
+        return False
+
+# Temporary file next to path (so that it can be atomically moved over it) keeping its extension, as some writers
+# (fbx exporter, render) add the extension when it's missing
+def get_temp_path(path):
+    path = pathlib.Path(path)
+    return path.with_name('{}.{}.tmp{}'.format(path.stem, os.getpid(), path.suffix))
+
+# Moves temp_path over path when their content differ, otherwise removes temp_path and leaves path untouched (mtime
+# included). Returns whether path was written.
+def commit(temp_path, path, stats=None):
+    size = os.path.getsize(temp_path)
+    if _is_same_file_content(temp_path, path):
+        os.remove(temp_path)
+        written = False
+    else:
+        os.replace(temp_path, path)
+        written = True
+    if stats is not None:
+        stats.add(size, written)
+    return written
+
+def discard(temp_path):
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+
+def write(path, data, stats=None):
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = get_temp_path(path)
+    try:
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        return commit(temp_path, path, stats)
+    except BaseException:
+        discard(temp_path)
+        raise
+
+def write_text(path, text, stats=None):
+    return write(path, text.encode('utf-8'), stats)
@@ -0,0 +1,54 @@
+import os
+
+_registries = []
+
+
+def _get_signature(filepaths):
+    signature = []
+    for filepath in filepaths:
+        try:
+            stat = os.stat(filepath)
+            signature.append((str(filepath), stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((str(filepath), None, None))
+    return tuple(signature)
+
+# Caches what loader(*key) returns and reloads it only when one of get_watched_filepaths(*key) changed (mtime or size).
+# Each key has its own entry, so alternating between a few keys doesn't reload anything.
+class FileRegistry:
+    def __init__(self, name, loader, get_watched_filepaths):
+        self.name = name
+        self.loader = loader
+        self.get_watched_filepaths = get_watched_filepaths
+        self.entries = {}
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        _registries.append(self)
+    
+    def get(self, *key):
+        signature = _get_signature(self.get_watched_filepaths(*key))
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == signature:
+            self.hits = self.hits + 1
+            return entry[1]
+        
+        if entry is None:
+            self.misses = self.misses + 1
+        else:
+            self.reloads = self.reloads + 1
+        value = self.loader(*key)
+        self.version = self.version + 1
+        self.entries[key] = (signature, value)
+        return value
+    
+    def clear(self):
+        self.entries.clear()
+        self.version = self.version + 1
+    
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'reloads': self.reloads, 'version': self.version, 'entries': len(self.entries)}
+
+def get_stats():
+    return {registry.name: registry.get_stats() for registry in _registries}
@@ -1,9 +1,20 @@
 import pathlib
-import functools
+import concurrent.futures
+import hashlib
+import json
+import numpy as np
 import os
 import pathlib
 import re
+import time
+from ..utils import cache as cache_utils
 from ..utils import materials as material_utils
+from ..utils import registry
+
+_CACHE_VERSION = 3
+_TEXTURE_EXT = '.dds'
+_MAX_SCAN_WORKERS = 8
+_INI_FILEPATH = pathlib.Path(__file__).parent / 'default_textures.ini'
 
 def _read_ini(filepath):
     file = open(filepath)
@@ -65,19 +76,53 @@ class Keyword:
         self.bonus = float(bonus)
         self.texture = texture if texture is not None else material
         self.malus = float(malus) if malus is not None else -self.bonus
+        self.material_regex = re.compile(self.material)
+        self.texture_regex = re.compile(self.texture)
     
     def __repr__(self):
         return '(r:' + self.material + ', ' + str(self.bonus) + ', r:' + self.texture + ', ' + str(self.malus) + ')'
     
     def match(self, material, texture, debug=False):
-        m = re.search(self.material, material) is not None
-        t = re.search(self.texture, texture) is not None
+        return self.score(self.material_regex.search(material) is not None, self.texture_regex.search(texture) is not None)
+    
+    def score(self, m, t):
         if t and m:
             return self.bonus
         elif t != m:
             return self.malus
         else:
             return 0.0
+    
+    @property
+    def score_table(self):
+        return np.array([[0.0, self.malus], [self.malus, self.bonus]])
+
+# hits[i, k] tells whether name i matches (material or texture) regex of keyword k
+def _get_keyword_hits(keywords, names, regex_attribute):
+    hits = np.zeros((len(names), len(keywords)), dtype=np.intp)
+    for k, keyword in enumerate(keywords):
+        regex = getattr(keyword, regex_attribute)
+        hits[:, k] = [regex.search(name) is not None for name in names]
+    return hits
+
+# scores[i, j] is the sum of keyword scores of material i with texture j
+def _get_keyword_scores(keywords, material_hits, texture_hits):
+    scores = np.zeros((material_hits.shape[0], texture_hits.shape[0]))
+    # Summed keyword by keyword, as Keyword.match used to be, so that scores (and their ties) are exactly the same
+    for k, keyword in enumerate(keywords):
+        scores += keyword.score_table[material_hits[:, k, np.newaxis], texture_hits[np.newaxis, :, k]]
+    return scores
+
+def _get_keyword_breakdown(keywords, material_hits, texture_hits):
+    bonus_keywords = []
+    malus_keywords = []
+    for k, keyword in enumerate(keywords):
+        keyword_score = keyword.score(material_hits[k], texture_hits[k])
+        if keyword_score > 0.0:
+            bonus_keywords.append(keyword)
+        elif keyword_score < 0.0:
+            malus_keywords.append(keyword)
+    return bonus_keywords, malus_keywords
 
 def _read_default_materials_ini(filepath):
     texture_dirs = []
@@ -99,95 +144,254 @@ def _read_default_materials_ini(filepath):
     
     return texture_dirs, preferred_suffixes, forbidden_suffixes, keywords
 
-def _get_default_material_textures(materials_filepath, ini_filepath, openplanet_extract_dir):
-    texture_dirs, preferred_suffixes, forbidden_suffixes, keywords = _read_default_materials_ini(ini_filepath)
+# endings[length] is the set of endings of that length, so that checking a name takes one lookup per distinct length
+def _get_endings(suffixes, ext):
+    endings = {}
+    for suffix in suffixes:
+        endings.setdefault(len(suffix + ext), set()).add(suffix + ext)
+    return endings
+
+def _has_ending(name, endings):
+    return any(name[-length:] in length_endings for length, length_endings in endings.items())
+
+# index[material] is the index of texture named <material><preferred suffix><ext> with the most preferred suffix
+def _get_perfect_match_index(texture_names, preferred_suffixes, ext):
+    index = {}
+    suffix_indices = {}
+    for texture_index, texture_name in enumerate(texture_names):
+        if texture_name[-len(ext):] != ext:
+            continue
+        stem = texture_name[:-len(ext)]
+        for suffix_index, suffix in enumerate(preferred_suffixes):
+            if suffix and stem[-len(suffix):] != suffix:
+                continue
+            material = stem[:len(stem) - len(suffix)]
+            if suffix_index < suffix_indices.get(material, len(preferred_suffixes)):
+                index[material] = texture_index
+                suffix_indices[material] = suffix_index
+    return index
+
+class TextureListing:
+    __slots__ = ('dirs', 'names', 'dir_indices', 'scanned_count')
+    
+    def __init__(self, dirs):
+        self.dirs = dirs
+        self.names = []
+        self.dir_indices = []
+        self.scanned_count = 0
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def get_path(self, texture_index):
+        return self.dirs[self.dir_indices[texture_index]] / self.names[texture_index]
+
+def _scan_texture_dir(texture_dir, ext, forbidden_endings):
+    names = []
+    scanned_count = 0
+    with os.scandir(texture_dir) as entries:
+        for entry in entries:
+            scanned_count = scanned_count + 1
+            name = entry.name
+            if name[-len(ext):] != ext or _has_ending(name, forbidden_endings):
+                continue
+            if entry.is_file():
+                names.append(name)
+    return names, scanned_count
+
+def _scan_textures(openplanet_extract_dir, texture_dirs, forbidden_suffixes, ext=_TEXTURE_EXT):
+    listing = TextureListing([pathlib.Path(openplanet_extract_dir) / texture_dir for texture_dir in texture_dirs])
+    forbidden_endings = _get_endings(forbidden_suffixes, ext)
+    
+    # Directories may be on slow / network storage: scan them concurrently, results are kept in ini order
+    max_workers = max(1, min(_MAX_SCAN_WORKERS, len(listing.dirs)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        dir_listings = executor.map(lambda texture_dir: _scan_texture_dir(texture_dir, ext, forbidden_endings), listing.dirs)
+        for dir_index, (names, scanned_count) in enumerate(dir_listings):
+            listing.names.extend(names)
+            listing.dir_indices.extend([dir_index] * len(names))
+            listing.scanned_count = listing.scanned_count + scanned_count
+    return listing
+
+class DefaultMaterialTexturesReport:
+    def __init__(self):
+        self.material_count = 0
+        self.texture_count = 0
+        self.scanned_texture_count = 0
+        # [(material, texture path)]
+        self.perfect_matches = []
+        # [(material, texture path, score)]
+        self.scored_matches = []
+        # {material: [{'texture', 'score', 'bonus_keywords', 'malus_keywords'}]}, empty list if no texture scored above 0
+        self.ambiguous_materials = {}
+        # {phase: seconds} for 'scan', 'index', 'perfect_match' and 'scoring' phases ('cache_load' if loaded from cache)
+        self.timings = {}
+        self.from_cache = False
+    
+    @property
+    def match_count(self):
+        return len(self.perfect_matches) + len(self.scored_matches)
     
-    all_textures = []
-    for texture_dir in texture_dirs:
-        texture_dir = pathlib.Path(openplanet_extract_dir) / texture_dir
-        texture_filenames = os.listdir(texture_dir)
-        all_textures.extend([texture_dir / texture_filename for texture_filename in texture_filenames])
+    def get_summary(self):
+        return '{} / {} materials matched ({} perfect), {} ambiguous, {} / {} textures considered{}.'.format(
+            self.match_count, self.material_count, len(self.perfect_matches), len(self.ambiguous_materials),
+            self.texture_count, self.scanned_texture_count, ' (cached)' if self.from_cache else '')
     
+    def to_dict(self):
+        return {
+            'material_count': self.material_count,
+            'texture_count': self.texture_count,
+            'scanned_texture_count': self.scanned_texture_count,
+            'perfect_matches': [[material, str(texture)] for material, texture in self.perfect_matches],
+            'scored_matches': [[material, str(texture), score] for material, texture, score in self.scored_matches],
+            'ambiguous_materials': self.ambiguous_materials,
+            'timings': self.timings,
+            'from_cache': self.from_cache,
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        report = cls()
+        report.material_count = data['material_count']
+        report.texture_count = data['texture_count']
+        report.scanned_texture_count = data['scanned_texture_count']
+        report.perfect_matches = [(material, pathlib.Path(texture)) for material, texture in data['perfect_matches']]
+        report.scored_matches = [(material, pathlib.Path(texture), score) for material, texture, score in data['scored_matches']]
+        report.ambiguous_materials = data['ambiguous_materials']
+        report.timings = data['timings']
+        report.from_cache = data['from_cache']
+        return report
+    
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+def _keyword_to_dict(keyword, score):
+    return {'material': keyword.material, 'texture': keyword.texture, 'score': score}
+
+def _get_cache_key(materials_filepath, ini_filepath, listing):
+    materials_stat = os.stat(materials_filepath)
+    key = hashlib.sha1()
+    key.update('{}|{}|{}\n'.format(materials_filepath, materials_stat.st_mtime_ns, materials_stat.st_size).encode())
+    key.update(pathlib.Path(ini_filepath).read_bytes())
+    for texture_dir in listing.dirs:
+        key.update('\n{}'.format(texture_dir).encode())
+    key.update('\n{}|{}'.format(listing.scanned_count, listing.dir_indices).encode())
+    key.update('\n'.join(listing.names).encode())
+    return key.hexdigest()
+
+def _match_default_material_textures(materials_filepath, preferred_suffixes, keywords, listing, report, ext=_TEXTURE_EXT):
     all_materials = material_utils.get_trackmania_materials(materials_filepath)
-    ext = '.dds'
     worst_suffix_malus = -0.1
+    report.material_count = len(all_materials)
+    report.texture_count = len(listing)
+    report.scanned_texture_count = listing.scanned_count
     
-    # 1. Ignore textures with forbidden suffixes
-    allowed_textures = []
-    for texture in all_textures:
-        has_forbidden_suffix = False
-        for fs in forbidden_suffixes:
-            if texture.name[-len(fs + ext):] == fs + ext:
-                has_forbidden_suffix = True
-                break
-        if not has_forbidden_suffix:
-            allowed_textures.append(texture)
+    # 1. Textures with forbidden suffixes were already ignored while scanning
+    texture_names = listing.names
+    phase_start = time.perf_counter()
+    perfect_match_index = _get_perfect_match_index(texture_names, preferred_suffixes, ext)
+    report.timings['index'] = time.perf_counter() - phase_start
     
     # 2. Find a texture for each material
-    perfect_matches = []
+    phase_start = time.perf_counter()
     all_matches = []
+    imperfect_materials = []
     for material in all_materials:
         # 2.1. Perfect matches
-        texture = None
-        for ps in preferred_suffixes:
-            texture = next((t for t in allowed_textures if t.name == material + ps + ext), None)
-            if texture:
-                perfect_matches.append((material, texture))
-                all_matches.append((material, texture))
+        texture_index = perfect_match_index.get(material)
+        if texture_index is not None:
+            texture = listing.get_path(texture_index)
+            report.perfect_matches.append((material, texture))
+            all_matches.append((material, texture))
+        else:
+            imperfect_materials.append(material)
+    report.timings['perfect_match'] = time.perf_counter() - phase_start
+    
+    # 2.2. Imperfect matches
+    # 2.2.1 Calculate score of every material / texture pair
+    # 2.2.1.1 Keyword scores
+    phase_start = time.perf_counter()
+    material_hits = _get_keyword_hits(keywords, imperfect_materials, 'material_regex')
+    texture_hits = _get_keyword_hits(keywords, texture_names, 'texture_regex')
+    scores = _get_keyword_scores(keywords, material_hits, texture_hits)
+    # 2.2.1.2 Suffix scores
+    suffix_scores = np.full(len(texture_names), worst_suffix_malus)
+    for texture_index, texture_name in enumerate(texture_names):
+        for preferred_suffix_index in range(0, len(preferred_suffixes)):
+            ps = preferred_suffixes[preferred_suffix_index]
+            if texture_name[-len(ps + ext):] == ps + ext:
+                suffix_scores[texture_index] = preferred_suffix_index / len(preferred_suffixes) * worst_suffix_malus
                 break
-        if texture:
-            continue
-        # 2.2. Imperfect matches
-        # 2.2.1 Calculate score for every textures
-        best_textures = []
-        for texture in allowed_textures:
-            score = 0
-            bonus_keywords = []
-            malus_keywords = []
-            # 2.2.1.1 Keyword scores
-            for keyword in keywords:
-                keyword_score = keyword.match(material, texture.name)
-                score = score + keyword_score
-                if keyword_score > 0.0:
-                    bonus_keywords.append(keyword)
-                elif keyword_score < 0.0:
-                    malus_keywords.append(keyword)
-            # 2.2.1.2 Suffix scores
-            has_suffix = False
-            for preferred_suffix_index in range(0, len(preferred_suffixes)):
-                ps = preferred_suffixes[preferred_suffix_index]
-                if texture.name[-len(ps + ext):] == ps + ext:
-                    score = score + preferred_suffix_index / len(preferred_suffixes) * worst_suffix_malus
-                    has_suffix = True
-                    break
-            if not has_suffix:
-                score = score + worst_suffix_malus
-            best_textures.append((texture, score, bonus_keywords, malus_keywords))
-        
+    scores += suffix_scores
+    
+    for material_index, material in enumerate(imperfect_materials):
         # 2.2.2 Isolate best textures
-        best_textures = sorted(best_textures, key=lambda best_texture: -best_texture[1])
-        best_textures = [t for t in best_textures if t[1] == best_textures[0][1] and t[1] > 0.0]
+        material_scores = scores[material_index]
+        best_score = material_scores.max() if len(material_scores) else 0.0
+        best_texture_indices = np.flatnonzero(material_scores == best_score) if best_score > 0.0 else []
         
         # 2.2.3 Got exactly one best texture
-        if len(best_textures) == 1:
-            all_matches.append((material, best_textures[0][0]))
+        if len(best_texture_indices) == 1:
+            texture = listing.get_path(best_texture_indices[0])
+            report.scored_matches.append((material, texture, float(best_score)))
+            all_matches.append((material, texture))
         else:
-            print('Cannot find a best texture for ' + material + ':')
-            for best_texture in best_textures:
-                print('-', best_texture[0].name, best_texture[2], best_texture[3])
-    
-    all_matches = sorted(all_matches, key=lambda match: match[0])
-    for m in all_matches:
-        print(m)
-    print('valid textures:', len(allowed_textures), '/', len(all_textures))
-    print('perfect matches:', len(perfect_matches) , '/', len(all_materials))
-    print('all matches:', len(all_matches) , '/', len(all_materials))
-    return all_matches
-
-@functools.lru_cache(maxsize=1)
-def get_default_material_textures(materials_filepath, openplanet_extract_dir):
-    return _get_default_material_textures(
-        materials_filepath,
-        pathlib.Path(__file__).parent / 'default_textures.ini',
-        openplanet_extract_dir
-    )
+            candidates = []
+            for texture_index in best_texture_indices:
+                bonus_keywords, malus_keywords = _get_keyword_breakdown(keywords, material_hits[material_index], texture_hits[texture_index])
+                candidates.append({
+                    'texture': str(listing.get_path(texture_index)),
+                    'score': float(best_score),
+                    'bonus_keywords': [_keyword_to_dict(keyword, keyword.bonus) for keyword in bonus_keywords],
+                    'malus_keywords': [_keyword_to_dict(keyword, keyword.malus) for keyword in malus_keywords],
+                })
+            report.ambiguous_materials[material] = candidates
+    report.timings['scoring'] = time.perf_counter() - phase_start
+    
+    return sorted(all_matches, key=lambda match: match[0])
+
+def _get_default_material_textures(materials_filepath, ini_filepath, openplanet_extract_dir, cache_filepath=None):
+    report = DefaultMaterialTexturesReport()
+    texture_dirs, preferred_suffixes, forbidden_suffixes, keywords = _read_default_materials_ini(ini_filepath)
+    phase_start = time.perf_counter()
+    listing = _scan_textures(openplanet_extract_dir, texture_dirs, forbidden_suffixes)
+    scan_time = time.perf_counter() - phase_start
+    
+    # Reuse matches of a previous session if material library, ini file and texture listings didn't change
+    cache_key = None
+    if cache_filepath is not None:
+        phase_start = time.perf_counter()
+        cache_key = _get_cache_key(materials_filepath, ini_filepath, listing)
+        cached = cache_utils.load(cache_filepath, _CACHE_VERSION, cache_key)
+        if cached is not None:
+            report = DefaultMaterialTexturesReport.from_dict(cached['report'])
+            report.from_cache = True
+            report.timings = {'scan': scan_time, 'cache_load': time.perf_counter() - phase_start}
+            return [(material, pathlib.Path(texture)) for material, texture in cached['matches']], report
+    
+    report.timings['scan'] = scan_time
+    all_matches = _match_default_material_textures(materials_filepath, preferred_suffixes, keywords, listing, report)
+    
+    if cache_filepath is not None:
+        cache_utils.save(cache_filepath, _CACHE_VERSION, cache_key, {
+            'matches': [(material, str(texture)) for material, texture in all_matches],
+            'report': report.to_dict(),
+        })
+    return all_matches, report
+
+def _get_default_material_textures_watched_filepaths(materials_filepath, openplanet_extract_dir, cache_filepath=None):
+    # Texture directories' mtime changes whenever a texture is added, removed or renamed
+    texture_dirs = _read_ini(_INI_FILEPATH).get('TEXTURE_DIRS', [])
+    return [materials_filepath, _INI_FILEPATH] + [pathlib.Path(openplanet_extract_dir) / texture_dir for texture_dir in texture_dirs]
+
+def _load_default_material_textures(materials_filepath, openplanet_extract_dir, cache_filepath=None):
+    return _get_default_material_textures(materials_filepath, _INI_FILEPATH, openplanet_extract_dir, cache_filepath)
+
+_default_material_textures_registry = registry.FileRegistry(
+    'default_material_textures',
+    _load_default_material_textures,
+    _get_default_material_textures_watched_filepaths
+)
+
+def get_default_material_textures(materials_filepath, openplanet_extract_dir, cache_filepath=None):
+    return _default_material_textures_registry.get(materials_filepath, openplanet_extract_dir, cache_filepath)
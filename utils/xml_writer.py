@@ -0,0 +1,50 @@
+import contextlib
+
+_ATTRIBUTE_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '"': '&quot;', '>': '&gt;'})
+
+
+def _escape_attribute(value):
+    return str(value).translate(_ATTRIBUTE_ESCAPES)
+
+# Writes indented XML in a single pass, laid out like minidom's toprettyxml (tab indentation, self-closing empty
+# elements). Attributes are written in the given order so that identical input always gives identical output.
+class XmlWriter:
+    def __init__(self, stream, indent='\t'):
+        self.stream = stream
+        self.indent = indent
+        # For each open element: (tag, has_children)
+        self.open_elements = []
+        self.stream.write('<?xml version="1.0" ?>\n')
+    
+    def _open_parent(self):
+        if self.open_elements and not self.open_elements[-1][1]:
+            self.stream.write('>\n')
+            self.open_elements[-1] = (self.open_elements[-1][0], True)
+    
+    def _write_start_tag(self, tag, attributes):
+        self._open_parent()
+        self.stream.write(self.indent * len(self.open_elements) + '<' + tag)
+        for name, value in attributes:
+            self.stream.write(' {}="{}"'.format(name, _escape_attribute(value)))
+    
+    # attributes is a sequence of (name, value) pairs
+    def start(self, tag, attributes=()):
+        self._write_start_tag(tag, attributes)
+        self.open_elements.append((tag, False))
+    
+    def end(self):
+        tag, has_children = self.open_elements.pop()
+        if has_children:
+            self.stream.write(self.indent * len(self.open_elements) + '</' + tag + '>\n')
+        else:
+            self.stream.write('/>\n')
+    
+    def leaf(self, tag, attributes=()):
+        self._write_start_tag(tag, attributes)
+        self.stream.write('/>\n')
+    
+    @contextlib.contextmanager
+    def element(self, tag, attributes=()):
+        self.start(tag, attributes)
+        yield self
+        self.end()